@@ -1,204 +1,247 @@
 from experta import KnowledgeEngine, Fact, Rule, MATCH, TEST
-from rules import RULES
-from huggingface_hub import InferenceClient
-import re
-import os
-from dotenv import load_dotenv
-load_dotenv() 
-
-HF_TOKEN = os.getenv("HF_TOKEN")
-client = InferenceClient(model="meta-llama/Meta-Llama-3-8B-Instruct", token=HF_TOKEN)
+from rules import savings_range
+from registry import RULE_INDEX, ORDERED_RULES, RULES_BY_FACT, ui_rank
+from inputs import FACT_DEFAULTS
+from rephrase import rephrase_all, iter_job_replies, polish, MAX_CONCURRENCY, CALL_TIMEOUT
+import history
+import metrics
+import threading
+import queue
 
 # Define facts used in the expert system
 class EnergyFacts(Fact):
     pass
 
+# Rephrasing job for one fired rule. history records the numeric savings range;
+# the "min-max" string (as rules.format_savings) is what users and the LLM see.
+def _job(name, raw, savings, facts, confidence):
+    low, high = savings_range(savings, facts)
+    return {'name': name, 'raw': raw, 'savings_str': f"{low}-{high}", 'savings_range': (low, high),
+            'confidence': confidence}
+
 # Main expert system engine
 class EnergyAdvisor(KnowledgeEngine):
-    def __init__(self):
+    def __init__(self, max_concurrency=MAX_CONCURRENCY, llm_timeout=CALL_TIMEOUT, rephrase_mode=None, render_policy=None):
         super().__init__()
         self.recommendations = []   
         self.fired_rules = []       
         self.explanations = []      
-
-    # Rule: If any incandescent bulbs - suggest LED upgrade
-    @Rule(EnergyFacts(incandescent_count=MATCH.count) & TEST(lambda count: count > 0))
-    def led_lighting_rule(self, count):
-        rule = next(r for r in RULES if r['name'] == 'LED_Lighting')
-        self._apply_rule(rule, count=count)
-
-    # Rule: If any CFL bulbs - suggest upgrading to LED
-    @Rule(EnergyFacts(cfl_count=MATCH.count) & TEST(lambda count: count > 0))
-    def cfl_to_led_rule(self, count):
-        rule = next(r for r in RULES if r['name'] == 'CFL_to_LED')
-        self._apply_rule(rule, count=count)
-
-    # Rule: AC used >= 5 hours - reduce usage
-    @Rule(EnergyFacts(has_ac=True, ac_hours=MATCH.hours) & TEST(lambda hours: hours >= 5))
-    def ac_usage_reduction_rule(self, hours):
-        rule = next(r for r in RULES if r['name'] == 'AC_Usage_Reduction')
-        self._apply_rule(rule, hours=hours)
-        
-    # Rule: Any AC usage - clean filters
-    @Rule(EnergyFacts(has_ac=True, ac_hours=MATCH.hours) & TEST(lambda hours: hours > 0))
-    def ac_efficiency_rule(self, hours):
-        rule = next(r for r in RULES if r['name'] == 'AC_Efficiency')
-        self._apply_rule(rule, hours=hours)
-
-    # Rule: Fans used >= 3 hours - suggest BLDC upgrade
-    @Rule(EnergyFacts(has_fans=True, fan_count=MATCH.count, fan_hours=MATCH.hours) 
-          & TEST(lambda count: count > 0) 
-          & TEST(lambda hours: hours >= 3))
-    def fan_efficiency_rule(self, count, hours):
-        rule = next(r for r in RULES if r['name'] == 'Fan_Efficiency')
-        self._apply_rule(rule, count=count, hours=hours)
-        
-    # Rule: Windows closed + fans on - suggest natural ventilation
-    @Rule(EnergyFacts(windows_closed=True, has_fans=True))
-    def natural_ventilation_rule(self):
-        rule = next(r for r in RULES if r['name'] == 'Natural_Ventilation')
-        self._apply_rule(rule)
-
-    # Rule: Fridge opened >= 10 times/day - suggest batching
-    @Rule(EnergyFacts(fridge_door_opens=MATCH.opens) & TEST(lambda opens: opens >= 10))
-    def fridge_door_habits_rule(self, opens):
-        rule = next(r for r in RULES if r['name'] == 'Fridge_Door_Habits')
-        self._apply_rule(rule, opens=opens)
-
-    # Rule: Fridge >= 10 years old - suggest replacement
-    @Rule(EnergyFacts(fridge_age=MATCH.age) & TEST(lambda age: age >= 10))
-    def old_fridge_replace_rule(self, age):
-        rule = next(r for r in RULES if r['name'] == 'Old_Fridge_Replace')
-        self._apply_rule(rule, age=age)
-        
-    # Rule: Fridge >= 5 years old - suggest defrosting
-    @Rule(EnergyFacts(fridge_age=MATCH.age) & TEST(lambda age: age >= 5))
-    def fridge_defrost_rule(self, age):
-        rule = next(r for r in RULES if r['name'] == 'Fridge_Defrost')
-        self._apply_rule(rule, age=age)
-
-    # Rule: Rice cooker keep-warm >= 2 hours - suggest timer
-    @Rule(EnergyFacts(has_rice_cooker=True, rice_cooker_keep_warm=MATCH.hours) & TEST(lambda hours: hours >= 2))
-    def rice_cooker_timer_rule(self, hours):
-        rule = next(r for r in RULES if r['name'] == 'Rice_Cooker_Timer')
-        self._apply_rule(rule, hours=hours)
-
-    # Rule: Water heater used >= 2 hours - suggest timer
-    @Rule(EnergyFacts(has_water_heater=True, heater_hours=MATCH.hours) & TEST(lambda hours: hours >= 2))
-    def water_heater_timer_rule(self, hours):
-        rule = next(r for r in RULES if r['name'] == 'Water_Heater_Timer')
-        self._apply_rule(rule, hours=hours)
-
-    # Rule: Any water heater use - suggest lower temperature
-    @Rule(EnergyFacts(has_water_heater=True, heater_hours=MATCH.hours) & TEST(lambda hours: hours > 0))
-    def water_heater_temp_rule(self, hours):
-        rule = next(r for r in RULES if r['name'] == 'Water_Heater_Temp')
-        self._apply_rule(rule, hours=hours)
-
-    # Rule: Peak hour usage >= 3 hours - suggest shifting
-    @Rule(EnergyFacts(peak_hour_use=True, total_appliance_hours=MATCH.hours) & TEST(lambda hours: hours >= 3))
-    def peak_hour_shift_rule(self, hours):
-        rule = next(r for r in RULES if r['name'] == 'Peak_Hour_Shift')
-        self._apply_rule(rule, hours=hours)
-        
-    # Rule: Lights left on >= 1 hour - suggest timers
-    @Rule(EnergyFacts(lights_left_on=MATCH.hours) & TEST(lambda hours: hours >= 1))
-    def lights_timers_rule(self, hours):
-        rule = next(r for r in RULES if r['name'] == 'Lights_Timers')
-        self._apply_rule(rule, hours=hours)
-
-    # Rule: Iron used >= 0.5 hours - suggest batching
-    @Rule(EnergyFacts(iron_hours=MATCH.hours) & TEST(lambda hours: hours >= 0.5))
-    def iron_batching_rule(self, hours):
-        rule = next(r for r in RULES if r['name'] == 'Iron_Batching')
-        self._apply_rule(rule, hours=hours)
-
-    # Rule: Standby appliances not unplugged - suggest unplugging
-    @Rule(EnergyFacts(unplug_habit=False))
-    def standby_unplug_rule(self):
-        rule = next(r for r in RULES if r['name'] == 'Standby_Unplug')
-        self._apply_rule(rule)
+        self.max_concurrency = max_concurrency   # Parallel LLM calls per request
+        self.llm_timeout = llm_timeout           # Seconds allowed per LLM call
+        self.rephrase_mode = rephrase_mode       # 'per_rule' or 'batched', None for the default
+        self.render_policy = render_policy       # 'template', 'deadline' or 'always', None for the default
 
     # Helper: Apply a rule and store its data
-    def _apply_rule(self, rule, **kwargs):
-        self.recommendations.append({'name': rule['name'], 'text': rule['recommendation']})
-        self.fired_rules.append(rule['name'])
+    def _apply_rule(self, rule):
+        self.recommendations.append({'name': rule.name, 'text': rule.recommendation})
+        self.fired_rules.append(rule.name)
         
         exp_data = {
-            'name': rule['name'],
-            'raw': rule['explanation'],
-            'savings': rule['savings'],
-            'confidence': rule['confidence'],
-            'facts': kwargs
+            'name': rule.name,
+            'raw': rule.explanation,
+            'savings': rule.savings,
+            'confidence': rule.confidence
         }
         self.explanations.append(exp_data)
 
-    # Main function: Run the expert system and generate polished output
-    def run_advisor(self, user_facts):
-        self.reset()
-        self.declare(EnergyFacts(**user_facts))
-        self.run()
-        polished_exps = []
-        
-        # UI order for recommendations
-        ui_category_order = [
-            "AC_Usage_Reduction", "AC_Efficiency", "Fan_Efficiency", "Natural_Ventilation",
-            "Water_Heater_Timer", "Water_Heater_Temp", "Rice_Cooker_Timer",
-            "Fridge_Defrost", "Fridge_Door_Habits", "Old_Fridge_Replace",
-            "LED_Lighting", "CFL_to_LED", "Lights_Timers",
-            "Iron_Batching", "Peak_Hour_Shift", "Standby_Unplug"
-        ]
+    # Helper: Fire the rules and build one rephrasing job per recommendation, in UI order.
+    # The result is queued for the advice history, tagged with `district` when given.
+    def _evaluate(self, user_facts, district=None):
+        self.recommendations = []
+        self.fired_rules = []
+        self.explanations = []
+        # Facts left out take the form defaults, as in the rules' own conditions
+        facts = {**FACT_DEFAULTS, **user_facts}
+        with metrics.span('advisor.declare'):
+            self.reset()
+            self.declare(EnergyFacts(**facts))
+        with metrics.span('advisor.rete_run'):
+            self.run()
+        metrics.count('advisor.rules_fired', len(self.fired_rules))
         
         # Sort recommendations by UI order
-        items = list(zip(self.recommendations, self.fired_rules, self.explanations))
-        items_sorted = sorted(
-            items,
-            key=lambda item: ui_category_order.index(item[1]) if item[1] in ui_category_order else len(ui_category_order)
-        )
-        recs_sorted, fired_rules_sorted, exps_sorted = zip(*items_sorted) if items else ([], [], [])
+        with metrics.span('advisor.sort'):
+            items = list(zip(self.recommendations, self.fired_rules, self.explanations))
+            items_sorted = sorted(
+                items,
+                key=lambda item: ui_rank(item[1])
+            )
+            recs_sorted, fired_rules_sorted, exps_sorted = zip(*items_sorted) if items else ([], [], [])
         
-        # Process each explanation with LLM
-        for exp in exps_sorted:
-            dynamic_facts = user_facts.copy()
-            dynamic_facts.update(exp['facts'])
-            
-            savings = exp['savings']
-            if callable(savings):
-                min_save, max_save = savings(dynamic_facts)
-                savings_str = f"{min_save}-{max_save}"
-            else:
-                savings_str = savings.replace("Save ~LKR ", "").replace("/month.", "")
-            
-            prompt = f"Rephrase the following into 1-2 natural sentences. Use **LKR** only (never 'dollars', 'units', or 'kWh'). Include exact savings: ~LKR {savings_str}/month and confidence: {exp['confidence']}%.\nInput: {exp['raw']}"
-            
-            try:
-                response = client.chat_completion(messages=[{"role": "user", "content": prompt}])
-                content = response.choices[0].message.content.strip()
-            except Exception:
-                content = None
-
-            if content:
-                content = content.replace("dollar", "LKR").replace("Dollar", "LKR").replace("USD", "LKR")
-                content = content.replace("unit", "LKR").replace("Unit", "LKR")
-                content = content.replace("kWh", "LKR")
-                
-                content = re.sub(r'\(I[^\)]*\)', '', content)
-                content = re.sub(r'\([^\)]*removed[^\)]*\)', '', content, flags=re.I)
-                content = re.sub(r'\([^\)]*natural[^\)]*\)', '', content, flags=re.I)
-                
-                lines = [line.strip() for line in content.split('\n') if line.strip()]
-                content = ' '.join(lines)
-            else:
-                content = f"{exp['raw']} (Savings: ~LKR {savings_str}/month, Confidence: {exp['confidence']}%)"
-
-            if savings_str not in content:
-                content += f" (Savings: ~LKR {savings_str}/month)"
-            if f"{exp['confidence']}%" not in content:
-                content += f" (Confidence: {exp['confidence']}%)"
-                
-            polished_exps.append(content)
-        
-        return [rec['text'] for rec in recs_sorted], list(fired_rules_sorted), polished_exps
+        # Work out the savings shown in each explanation
+        jobs = []
+        with metrics.span('advisor.savings'):
+            for exp in exps_sorted:
+                jobs.append(_job(exp['name'], exp['raw'], exp['savings'], facts, exp['confidence']))
+
+        history.record(user_facts, fired_rules_sorted, [job['savings_range'] for job in jobs], district)
+        return [rec['text'] for rec in recs_sorted], list(fired_rules_sorted), jobs
+
+    # Main function: Run the expert system and generate polished output
+    def run_advisor(self, user_facts):
+        recs, fired, jobs = self._evaluate(user_facts)
+        return recs, fired, rephrase_all(jobs, self.max_concurrency, self.llm_timeout, self.rephrase_mode, self.render_policy)
+
+    # Streaming variant: yields every recommendation with its deterministic text first,
+    # then an update carrying the polished explanation as each LLM reply arrives
+    def iter_advice(self, user_facts):
+        recs, fired, jobs = self._evaluate(user_facts)
+        yield from stream_advice(recs, fired, jobs, self.max_concurrency, self.llm_timeout, self.rephrase_mode,
+                                 self.render_policy)
+
+# One experta rule per rule in the pack: the facts the rule reads are bound by name
+# and its compiled condition is the TEST, so the engine and batch.py share one definition
+def _engine_rule(record):
+    def fire(engine):
+        engine._apply_rule(record)
+    pattern = EnergyFacts(**{name: getattr(MATCH, name) for name in record.facts})
+    return Rule(pattern & TEST(record.test))(fire)
+
+for _record in ORDERED_RULES:
+    setattr(EnergyAdvisor, f"{_record.name.lower()}_rule", _engine_rule(_record))
+del _record
+
+# Advice events for already-fired rules; needs no engine, only the rephrasing jobs
+def stream_advice(recs, fired, jobs, max_concurrency=MAX_CONCURRENCY, llm_timeout=CALL_TIMEOUT, rephrase_mode=None,
+                  render_policy=None):
+    for i, (rec, name, job) in enumerate(zip(recs, fired, jobs)):
+        yield {'index': i, 'name': name, 'recommendation': rec, 'confidence': job['confidence'],
+               'explanation': polish(job, None), 'polished': False}
+
+    polished = 0
+    for i, content in iter_job_replies(jobs, max_concurrency, llm_timeout, rephrase_mode, render_policy):
+        polished += 1
+        yield {'index': i, 'name': fired[i], 'recommendation': recs[i], 'confidence': jobs[i]['confidence'],
+               'explanation': polish(jobs[i], content), 'polished': True}
+    metrics.count('advice.fallback', len(jobs) - polished)
+
+# Pool of ready-built engines that can be shared by every session. Building an
+# EnergyAdvisor discovers the rules and compiles the Rete network, so engines are
+# reused; each call borrows one only while its rules fire, not while the LLM runs.
+class AdvisorPool:
+    def __init__(self, size=4, max_concurrency=MAX_CONCURRENCY, llm_timeout=CALL_TIMEOUT, rephrase_mode=None,
+                 render_policy=None):
+        self.size = size
+        self.max_concurrency = max_concurrency
+        self.llm_timeout = llm_timeout
+        self.rephrase_mode = rephrase_mode
+        self.render_policy = render_policy
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    # Borrow an idle engine, building a new one while under `size`, else wait for one
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            build = self._created < self.size
+            if build:
+                self._created += 1
+        if not build:
+            return self._idle.get()
+        try:
+            return EnergyAdvisor(self.max_concurrency, self.llm_timeout, self.rephrase_mode, self.render_policy)
+        except Exception:
+            with self._lock:
+                self._created -= 1
+            raise
+
+    def _evaluate(self, user_facts, district=None):
+        with metrics.span('pool.acquire'):
+            engine = self._acquire()
+        try:
+            return engine._evaluate(user_facts, district)
+        finally:
+            self._idle.put(engine)
+
+    # Same results as EnergyAdvisor.run_advisor, safe to call from many threads
+    def run_advisor(self, user_facts):
+        recs, fired, jobs = self._evaluate(user_facts)
+        return recs, fired, rephrase_all(jobs, self.max_concurrency, self.llm_timeout, self.rephrase_mode, self.render_policy)
+
+    # Same events as EnergyAdvisor.iter_advice, safe to call from many threads
+    def iter_advice(self, user_facts):
+        recs, fired, jobs = self._evaluate(user_facts)
+        yield from stream_advice(recs, fired, jobs, self.max_concurrency, self.llm_timeout, self.rephrase_mode,
+                                 self.render_policy)
+
+    # Advice state for one user, re-evaluated incrementally between submissions
+    def session(self):
+        return AdviceSession(self)
+
+# One household's advice kept between form submissions. The first submission is a
+# full evaluation on `advisor` (an EnergyAdvisor or AdvisorPool); after that only the
+# rules reading a changed input are re-checked, and only explanations whose job
+# (savings or confidence) changed go back to the LLM. Not safe for concurrent use.
+class AdviceSession:
+    def __init__(self, advisor):
+        self.advisor = advisor
+        self.facts = None
+        self.advice = {}   # rule name -> {'recommendation', 'job', 'explanation' (None until polished)}
+
+    # Names of the rules whose result may differ from the stored one, None if nothing is stored
+    def affected_rules(self, user_facts):
+        if self.facts is None:
+            return None
+        affected = set()
+        for name, value in user_facts.items():
+            if self.facts.get(name) != value:
+                affected.update(RULES_BY_FACT.get(name, ()))
+        return affected
+
+    # Bring the stored advice up to date with user_facts
+    def _update(self, user_facts):
+        affected = self.affected_rules(user_facts)
+        if affected is None:
+            recs, fired, jobs = self.advisor._evaluate(user_facts)
+            self.advice = {name: {'recommendation': rec, 'job': job, 'explanation': None}
+                           for rec, name, job in zip(recs, fired, jobs)}
+        else:
+            with metrics.span('session.update', rules=len(affected)):
+                for name in affected:
+                    rule = RULE_INDEX[name]
+                    if not rule.condition(user_facts):
+                        self.advice.pop(name, None)
+                        continue
+                    job = _job(name, rule.explanation, rule.savings, user_facts, rule.confidence)
+                    previous = self.advice.get(name)
+                    if previous is None or previous['job'] != job:
+                        self.advice[name] = {'recommendation': rule.recommendation, 'job': job, 'explanation': None}
+            fired = sorted(self.advice, key=ui_rank)
+            history.record(user_facts, fired, [self.advice[name]['job']['savings_range'] for name in fired])
+        self.facts = dict(user_facts)
+
+    # Same events as iter_advice. Recommendations whose explanation was polished on
+    # an earlier submission come through once, already polished.
+    def iter_advice(self, user_facts):
+        self._update(user_facts)
+        names = sorted(self.advice, key=ui_rank)
+        entries = [self.advice[name] for name in names]
+        stale = []
+        for i, (name, entry) in enumerate(zip(names, entries)):
+            polished = entry['explanation'] is not None
+            if not polished:
+                stale.append(i)
+            yield {'index': i, 'name': name, 'recommendation': entry['recommendation'],
+                   'confidence': entry['job']['confidence'],
+                   'explanation': entry['explanation'] if polished else polish(entry['job'], None),
+                   'polished': polished}
+        metrics.count('session.reused', len(entries) - len(stale))
+
+        jobs = [entries[i]['job'] for i in stale]
+        polished = 0
+        for j, content in iter_job_replies(jobs, self.advisor.max_concurrency, self.advisor.llm_timeout,
+                                           self.advisor.rephrase_mode, self.advisor.render_policy):
+            polished += 1
+            i = stale[j]
+            entries[i]['explanation'] = polish(entries[i]['job'], content)
+            yield {'index': i, 'name': names[i], 'recommendation': entries[i]['recommendation'],
+                   'confidence': entries[i]['job']['confidence'], 'explanation': entries[i]['explanation'],
+                   'polished': True}
+        metrics.count('advice.fallback', len(jobs) - polished)
 
 # Test the system when running directly
 if __name__ == "__main__":
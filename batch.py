@@ -0,0 +1,79 @@
+import numpy as np
+from tariff import tariff_savings
+from registry import ORDERED_RULES
+from inputs import NUMBER_FIELDS, FLAG_FIELDS, FACT_COLUMNS, OPTIONAL_FIELDS
+
+# Convert a mapping of fact columns (dict of lists, DataFrame, ...) to typed arrays
+def _columns(table):
+    missing = [name for name in FACT_COLUMNS if name not in table and name not in OPTIONAL_FIELDS]
+    if missing:
+        raise ValueError(f"Missing fact columns: {', '.join(missing)}")
+
+    columns = {}
+    for name in FLAG_FIELDS:
+        columns[name] = np.asarray(table[name], dtype=bool)
+    for name, spec in NUMBER_FIELDS.items():
+        if name in table:
+            columns[name] = np.asarray(table[name], dtype=np.int64 if isinstance(spec['step'], int) else np.float64)
+    n = len(columns[FLAG_FIELDS[0]])
+    for name in OPTIONAL_FIELDS:
+        if name not in columns:
+            columns[name] = np.zeros(n, dtype=np.int64)
+    return columns
+
+# Fired-rule matrix and savings ranges for a whole table of households
+class BatchResult:
+    def __init__(self, names, fired, min_savings, max_savings):
+        self.names = names               # Rule names, one per column, in UI order
+        self.fired = fired               # (rows, rules) bool
+        self.min_savings = min_savings   # (rows, rules) int64 LKR/month, 0 where not fired
+        self.max_savings = max_savings
+
+    def __len__(self):
+        return self.fired.shape[0]
+
+    # Same shape as EnergyAdvisor: recommendations, fired rule names and "min-max" savings
+    def row(self, i):
+        cols = np.flatnonzero(self.fired[i])
+        recs = [ORDERED_RULES[j].recommendation for j in cols]
+        fired = [self.names[j] for j in cols]
+        savings = [f"{self.min_savings[i, j]}-{self.max_savings[i, j]}" for j in cols]
+        return recs, fired, savings
+
+# One rule's (low, high) savings for every household, fired or not, re-priced on
+# each household's tariff block where its consumption is known
+def _rule_savings(rule, columns):
+    if rule.vector_savings is not None:
+        low, high = rule.vector_savings(columns)
+    else:
+        low, high = rule.savings
+    return tariff_savings(columns['monthly_kwh'], low, high)
+
+# What each rule's savings formula gives for every household, whether or not the rule
+# fires: (min, max) int64 arrays of shape (rows, rules), columns in UI order
+def savings_ranges(table):
+    columns = _columns(table)
+    n = len(columns[FACT_COLUMNS[0]])
+    min_savings = np.zeros((n, len(ORDERED_RULES)), dtype=np.int64)
+    max_savings = np.zeros((n, len(ORDERED_RULES)), dtype=np.int64)
+    for j, rule in enumerate(ORDERED_RULES):
+        min_savings[:, j], max_savings[:, j] = _rule_savings(rule, columns)
+    return min_savings, max_savings
+
+# Evaluate every rule over every household in one pass
+def evaluate(table):
+    columns = _columns(table)
+    n = len(columns[FACT_COLUMNS[0]])
+    fired = np.zeros((n, len(ORDERED_RULES)), dtype=bool)
+    min_savings = np.zeros((n, len(ORDERED_RULES)), dtype=np.int64)
+    max_savings = np.zeros((n, len(ORDERED_RULES)), dtype=np.int64)
+
+    # Columns follow the UI order, so each row's fired rules come out already sorted
+    for j, rule in enumerate(ORDERED_RULES):
+        mask = rule.vector_condition(columns)
+        fired[:, j] = mask
+        low, high = _rule_savings(rule, columns)
+        min_savings[:, j] = np.where(mask, low, 0)
+        max_savings[:, j] = np.where(mask, high, 0)
+
+    return BatchResult([rule.name for rule in ORDERED_RULES], fired, min_savings, max_savings)
@@ -0,0 +1,296 @@
+from types import SimpleNamespace
+import statistics
+import itertools
+import asyncio
+import subprocess
+import argparse
+import platform
+import random
+import json
+import time
+import sys
+import os
+import re
+
+import batch
+import rephrase
+import llm
+from advisor import EnergyAdvisor, EnergyFacts, AdvisorPool
+from cache import ExplanationCache
+from rules import format_savings
+from inputs import NUMBER_FIELDS, FLAG_FIELDS, FACT_COLUMNS, field_values, validate_facts, build_facts
+
+# Local stand-in for huggingface_hub.InferenceClient with configurable latency and failures
+class FakeInferenceClient:
+    _PROMPT = re.compile(r"~LKR (\S+)/month and confidence: (\d+)%\.\nInput: (.*)", re.S)
+    _BATCH_ITEM = re.compile(r"^\d+\. (.*) \[Savings: ~LKR (\S+)/month, confidence: (\d+)%\]$", re.M)
+
+    def __init__(self, latency=0.05, jitter=0.2, failure_rate=0.0, seed=0):
+        self.latency = latency           # Mean seconds per call
+        self.jitter = jitter             # +/- fraction of the latency
+        self.failure_rate = failure_rate
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self._rng = random.Random(seed)
+
+    def chat_completion(self, messages, **kwargs):
+        time.sleep(self._delay())
+        return self._respond(messages)
+
+    def _delay(self):
+        self.calls += 1
+        return self.latency * (1 + self._rng.uniform(-self.jitter, self.jitter))
+
+    def _respond(self, messages):
+        prompt = messages[-1]['content']
+        if self._rng.random() < self.failure_rate:
+            raise RuntimeError("Simulated Inference API failure")
+
+        items = self._BATCH_ITEM.findall(prompt)
+        if items:
+            content = json.dumps([self._reply(raw, savings_str, confidence) for raw, savings_str, confidence in items])
+        else:
+            match = self._PROMPT.search(prompt)
+            savings_str, confidence, raw = match.groups() if match else ("0-0", "0", prompt)
+            content = self._reply(raw, savings_str, confidence)
+        usage = SimpleNamespace(prompt_tokens=len(prompt) // 4, completion_tokens=len(content) // 4)
+        self.prompt_tokens += usage.prompt_tokens
+        self.completion_tokens += usage.completion_tokens
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))], usage=usage)
+
+    @staticmethod
+    def _reply(raw, savings_str, confidence):
+        return (f"{raw.strip()}\nBy acting on this you could save around {savings_str} units "
+                f"(roughly LKR {savings_str}/month), with {confidence}% confidence. (I removed the dollars.)")
+
+# Same stand-in for huggingface_hub.AsyncInferenceClient: latency is awaited, not slept
+class FakeAsyncInferenceClient(FakeInferenceClient):
+    async def chat_completion(self, messages, **kwargs):
+        await asyncio.sleep(self._delay())
+        return self._respond(messages)
+
+# Inputs that only make sense together with the checkbox that enables them
+_DEPENDENT = {
+    'has_ac': ['ac_hours'],
+    'has_fans': ['fan_count', 'fan_hours'],
+    'has_rice_cooker': ['rice_cooker_keep_warm'],
+    'has_water_heater': ['heater_hours'],
+    'peak_hour_use': ['total_appliance_hours'],
+}
+
+# Random household facts spread over the form's input ranges; every profile passes validation
+def generate_profiles(n, seed=0):
+    rng = random.Random(seed)
+    domains = {name: field_values(name) for name in NUMBER_FIELDS}
+    profiles = []
+    while len(profiles) < n:
+        form = {name: rng.random() < 0.5 for name in FLAG_FIELDS}
+        form.update({name: rng.choice(values) for name, values in domains.items()})
+        for flag, names in _DEPENDENT.items():
+            for name in names:
+                if not form[flag]:
+                    form[name] = domains[name][0]
+                elif form[name] <= 0:
+                    form[name] = domains[name][1]
+        if not validate_facts(form):
+            profiles.append(build_facts(form))
+    return profiles
+
+# Time fn(item) for every item; per-call latency summary in milliseconds
+def measure(fn, items, repeat=1):
+    samples = []
+    for _ in range(repeat):
+        for item in items:
+            start = time.perf_counter()
+            fn(item)
+            samples.append((time.perf_counter() - start) * 1000)
+    return summarize(samples)
+
+def summarize(samples):
+    ordered = sorted(samples)
+    return {
+        'calls': len(samples),
+        'total_s': round(sum(samples) / 1000, 6),
+        'mean_ms': round(statistics.fmean(samples), 4),
+        'p50_ms': round(ordered[len(ordered) // 2], 4),
+        'p95_ms': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 4),
+        'max_ms': round(ordered[-1], 4),
+    }
+
+# Rete network only: reset, declare and run
+def bench_experta(profiles, repeat):
+    engine = EnergyAdvisor()
+
+    def run(facts):
+        engine.recommendations, engine.fired_rules, engine.explanations = [], [], []
+        engine.reset()
+        engine.declare(EnergyFacts(**facts))
+        engine.run()
+
+    return measure(run, profiles, repeat)
+
+# Savings strings for every rule a profile fires
+def bench_savings(profiles, repeat):
+    engine = EnergyAdvisor()
+    fired = []
+    for facts in profiles:
+        engine._evaluate(facts)
+        fired.append((facts, list(engine.explanations)))
+
+    def run(item):
+        facts, exps = item
+        for exp in exps:
+            format_savings(exp['savings'], facts)
+
+    return measure(run, fired, repeat)
+
+# Reply clean-up and figure checks, on replies shaped like the model's
+def bench_postprocess(profiles, repeat):
+    engine = EnergyAdvisor()
+    client = FakeInferenceClient(latency=0)
+    items = []
+    for facts in profiles:
+        for job in engine._evaluate(facts)[2]:
+            reply = client.chat_completion(messages=[{"role": "user", "content": rephrase.job_prompt(job)}])
+            items.append((job, reply.choices[0].message.content))
+
+    def run(item):
+        job, content = item
+        rephrase.polish(job, rephrase.clean_reply(content))
+
+    return measure(run, items, repeat)
+
+# Full advice per household through the pool, against the fake client and a cold cache
+def bench_end_to_end(profiles, concurrency, client, mode='per_rule', policy='always'):
+    llm.set_client(client)
+    rephrase.templates = {}
+    rephrase.cache = ExplanationCache(path=None, memory_entries=0)
+    pool = AdvisorPool(size=1, max_concurrency=concurrency, rephrase_mode=mode, render_policy=policy)
+    return measure(pool.run_advisor, profiles)
+
+# Load test of the HTTP service in process (httpx over ASGI), against the async fake
+# client and a cold cache. `requests` POSTs are sent `concurrency` at a time, cycling
+# through `distinct` households so identical fact sets overlap and get coalesced.
+def bench_service(profiles, requests, concurrency, client, distinct=None, deadline=10.0):
+    import httpx
+    from service import create_app
+
+    llm.set_async_client(client)
+    rephrase.templates = {}
+    rephrase.cache = ExplanationCache(path=None, memory_entries=0)
+    bodies = profiles[:distinct or len(profiles)]
+    samples = []
+    statuses = {}
+
+    async def main():
+        app = create_app(deadline=deadline)
+        semaphore = asyncio.Semaphore(concurrency)
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://advisor",
+                                     timeout=deadline + 5) as http:
+            async def post(body):
+                async with semaphore:
+                    start = time.perf_counter()
+                    response = await http.post("/advice", json=body)
+                    samples.append((time.perf_counter() - start) * 1000)
+                    statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+            start = time.perf_counter()
+            await asyncio.gather(*(post(bodies[i % len(bodies)]) for i in range(requests)))
+            return time.perf_counter() - start
+
+    elapsed = asyncio.run(main())
+    result = summarize(samples)
+    result['requests_per_s'] = round(requests / elapsed, 1)
+    result['statuses'] = {str(code): n for code, n in sorted(statuses.items())}
+    return result
+
+# Vectorized scoring of a whole table at once
+def bench_batch(profiles, repeat):
+    table = {name: [facts[name] for facts in profiles] for name in FACT_COLUMNS}
+    result = measure(batch.evaluate, [table], repeat)
+    result['rows_per_s'] = round(len(profiles) / (result['total_s'] / result['calls']))
+    return result
+
+# Modules timed by the import stage, from the rules-only path up to the full advisor
+IMPORT_MODULES = ('registry', 'batch', 'rephrase', 'advisor')
+
+# Cold import of a module in a fresh interpreter, and whether it pulled in huggingface_hub
+def bench_import(module, repeat):
+    code = (f"import sys, time\nstart = time.perf_counter()\nimport {module}\n"
+            f"print(time.perf_counter() - start, 'huggingface_hub' in sys.modules)")
+    samples = []
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__))).stdout.split()
+        samples.append(float(out[0]) * 1000)
+    result = summarize(samples)
+    result['loads_huggingface_hub'] = out[1] == 'True'
+    return result
+
+def run_benchmarks(sizes, concurrency_levels, latency, failure_rate, repeat, seed, modes=('per_rule',), service_requests=0,
+                   policies=('always',)):
+    results = []
+    profiles = generate_profiles(max(sizes), seed)
+
+    def record(stage, params, stats):
+        results.append({'stage': stage, 'params': params, **stats})
+        print(f"{stage:<12} {json.dumps(params):<48} mean {stats['mean_ms']:>10.3f} ms  p95 {stats['p95_ms']:>10.3f} ms")
+
+    for module in IMPORT_MODULES:
+        record('import', {'module': module}, bench_import(module, repeat))
+
+    for size in sizes:
+        record('experta', {'profiles': size}, bench_experta(profiles[:size], repeat))
+        record('savings', {'profiles': size}, bench_savings(profiles[:size], repeat))
+        record('postprocess', {'profiles': size}, bench_postprocess(profiles[:size], repeat))
+        record('batch', {'profiles': size}, bench_batch(profiles[:size], repeat))
+
+    for policy, mode, size, concurrency in itertools.product(policies, modes, sizes, concurrency_levels):
+        client = FakeInferenceClient(latency, failure_rate=failure_rate, seed=seed)
+        stats = bench_end_to_end(profiles[:size], concurrency, client, mode, policy)
+        stats['llm_calls'] = client.calls
+        stats['prompt_tokens'] = client.prompt_tokens
+        stats['completion_tokens'] = client.completion_tokens
+        record('end_to_end', {'policy': policy, 'mode': mode, 'profiles': size, 'concurrency': concurrency,
+                              'latency_s': latency, 'failure_rate': failure_rate}, stats)
+
+    if service_requests:
+        for concurrency in concurrency_levels:
+            client = FakeAsyncInferenceClient(latency, failure_rate=failure_rate, seed=seed)
+            stats = bench_service(profiles, service_requests, concurrency, client, distinct=max(sizes))
+            stats['llm_calls'] = client.calls
+            record('service', {'requests': service_requests, 'distinct': max(sizes), 'concurrency': concurrency,
+                               'latency_s': latency, 'failure_rate': failure_rate}, stats)
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the advisor pipeline against a local stand-in for the Inference API.")
+    parser.add_argument("--output", default="bench_results.json", help="JSON results file (default: %(default)s)")
+    parser.add_argument("--sizes", default="1,10,50", help="comma-separated profile counts (default: %(default)s)")
+    parser.add_argument("--concurrency", default="1,4,16", help="comma-separated LLM concurrency levels (default: %(default)s)")
+    parser.add_argument("--latency", type=float, default=0.05, help="mean seconds per fake LLM call (default: %(default)s)")
+    parser.add_argument("--failure-rate", type=float, default=0.05, help="fraction of fake LLM calls that fail (default: %(default)s)")
+    parser.add_argument("--modes", default="per_rule,batched", help="comma-separated rephrasing modes (default: %(default)s)")
+    parser.add_argument("--policies", default="always", help="comma-separated rendering policies (default: %(default)s)")
+    parser.add_argument("--service-requests", type=int, default=0,
+                        help="also load-test the HTTP service with this many requests (default: off)")
+    parser.add_argument("--repeat", type=int, default=3, help="repetitions for the local and import stages (default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    sizes = [int(x) for x in args.sizes.split(",")]
+    concurrency_levels = [int(x) for x in args.concurrency.split(",")]
+    modes = args.modes.split(",")
+    results = run_benchmarks(sizes, concurrency_levels, args.latency, args.failure_rate, args.repeat, args.seed, modes,
+                             args.service_requests, args.policies.split(","))
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump({
+            'created': time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'args': vars(args),
+            'results': results,
+        }, f, indent=2)
+    print(f"Wrote {len(results)} results to {args.output}")
@@ -0,0 +1,167 @@
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque
+from itertools import islice
+import argparse
+import json
+import csv
+import sys
+import os
+
+import batch
+from registry import RULE_INDEX
+from inputs import FACT_COLUMNS, parse_record, validate_facts, build_facts
+
+OUTPUT_COLUMNS = ['row', 'id', 'errors', 'fired_rules', 'savings', 'recommendations', 'explanations']
+
+# Stands in for a JSONL line that isn't a JSON object; its row is reported with the error
+class InvalidRecord:
+    __slots__ = ('error',)
+
+    def __init__(self, error):
+        self.error = error
+
+# Stream records from a CSV or JSONL file ('-' reads stdin), one dict at a time.
+# Malformed JSONL lines come through as InvalidRecord, so one bad line doesn't end the run.
+def read_records(path, fmt):
+    f = sys.stdin if path == '-' else open(path, newline='', encoding='utf-8')
+    try:
+        if fmt == 'csv':
+            yield from csv.DictReader(f)
+        else:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError as exc:
+                    yield InvalidRecord(f"Invalid JSON: {exc.msg} at column {exc.colno}.")
+                    continue
+                if isinstance(record, dict):
+                    yield record
+                else:
+                    yield InvalidRecord("The record is not a JSON object.")
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+# Writes one advice record at a time as JSONL or CSV
+class RecordWriter:
+    def __init__(self, f, fmt):
+        self.f = f
+        self.fmt = fmt
+        if fmt == 'csv':
+            self.writer = csv.DictWriter(f, fieldnames=OUTPUT_COLUMNS, extrasaction='ignore')
+            self.writer.writeheader()
+
+    def write(self, record):
+        if self.fmt == 'csv':
+            row = dict(record)
+            row['savings'] = ' | '.join(f"{name}:{value}" for name, value in record.get('savings', {}).items())
+            for key in ('errors', 'fired_rules', 'recommendations', 'explanations'):
+                row[key] = ' | '.join(record.get(key, []))
+            self.writer.writerow(row)
+        else:
+            self.f.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+# Advise one chunk of (row number, raw record) pairs. Valid rows are scored together
+# by the batch engine; with use_llm the explanations are rephrased concurrently.
+def process_chunk(chunk, use_llm=True):
+    results = []
+    valid = []
+    for row_no, record in chunk:
+        result = {'row': row_no}
+        if isinstance(record, InvalidRecord):
+            result['errors'] = [record.error]
+            results.append(result)
+            continue
+        if record.get('id') not in (None, ''):
+            result['id'] = record['id']
+        form, errors = parse_record(record)
+        if not errors:
+            errors = validate_facts(form)
+        if errors:
+            result['errors'] = errors
+        else:
+            valid.append((result, build_facts(form)))
+        results.append(result)
+
+    if valid:
+        scored = batch.evaluate({name: [facts[name] for _, facts in valid] for name in FACT_COLUMNS})
+        jobs = []
+        for i, (result, _) in enumerate(valid):
+            recs, fired, savings = scored.row(i)
+            result['fired_rules'] = fired
+            result['recommendations'] = recs
+            result['savings'] = dict(zip(fired, savings))
+            for name, savings_str in zip(fired, savings):
+                rule = RULE_INDEX[name]
+                jobs.append({'name': name, 'raw': rule.explanation, 'savings_str': savings_str,
+                             'confidence': rule.confidence})
+
+        if use_llm:
+            from rephrase import rephrase_all
+            explanations = iter(rephrase_all(jobs))
+            for result, _ in valid:
+                result['explanations'] = list(islice(explanations, len(result['fired_rules'])))
+    return results
+
+# Split a record stream into numbered chunks without reading ahead
+def _chunks(records, size):
+    records = enumerate(records, start=1)
+    while True:
+        chunk = list(islice(records, size))
+        if not chunk:
+            return
+        yield chunk
+
+# Advise every record, keeping at most a few chunks in memory at once.
+# Results come back in input order.
+def run(records, writer, use_llm=True, workers=1, chunk_size=1000):
+    if chunk_size < 1:
+        raise ValueError("chunk_size must be at least 1")
+    if workers <= 1:
+        for chunk in _chunks(records, chunk_size):
+            for result in process_chunk(chunk, use_llm):
+                writer.write(result)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        in_flight = deque()
+        for chunk in _chunks(records, chunk_size):
+            in_flight.append(executor.submit(process_chunk, chunk, use_llm))
+            if len(in_flight) >= 2 * workers:
+                for result in in_flight.popleft().result():
+                    writer.write(result)
+        while in_flight:
+            for result in in_flight.popleft().result():
+                writer.write(result)
+
+def _format(path, fmt):
+    if fmt:
+        return fmt
+    return 'csv' if os.path.splitext(path)[1].lower() == '.csv' else 'jsonl'
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run household records from CSV or JSONL through the energy advisor.")
+    parser.add_argument("input", help="CSV or JSONL file of household facts ('-' for stdin)")
+    parser.add_argument("-o", "--output", default="-", help="output file (default: stdout)")
+    parser.add_argument("--input-format", choices=["csv", "jsonl"], help="default: from the file extension")
+    parser.add_argument("--output-format", choices=["csv", "jsonl"], help="default: from the file extension")
+    parser.add_argument("--no-llm", action="store_true", help="rule evaluation only, no rephrased explanations")
+    parser.add_argument("--workers", type=int, default=1, help="worker processes (default: 1)")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="records per unit of work (default: 1000)")
+    args = parser.parse_args()
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+    if args.chunk_size < 1:
+        parser.error("--chunk-size must be at least 1")
+
+    out = sys.stdout if args.output == '-' else open(args.output, 'w', newline='', encoding='utf-8')
+    try:
+        records = read_records(args.input, _format(args.input, args.input_format))
+        writer = RecordWriter(out, _format(args.output, args.output_format))
+        run(records, writer, use_llm=not args.no_llm, workers=args.workers, chunk_size=args.chunk_size)
+    finally:
+        if out is not sys.stdout:
+            out.close()
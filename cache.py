@@ -0,0 +1,160 @@
+from collections import OrderedDict
+import hashlib
+import sqlite3
+import threading
+import time
+import re
+
+_WHITESPACE = re.compile(r'\s+')
+
+# Content-addressed key: the model name plus the whitespace-normalized prompt
+def prompt_key(model, prompt):
+    normalized = _WHITESPACE.sub(' ', prompt).strip()
+    return hashlib.sha256(f"{model}\n{normalized}".encode('utf-8')).hexdigest()
+
+# Two-level cache for rephrased explanations: an in-process LRU in front of SQLite.
+# Entries older than `ttl` seconds are treated as missing; the LRU keeps at most
+# `memory_entries`. The disk store is cut back to `max_entries` rows (least recently
+# used go first) once it grows 10% past that, rather than on every put, and hits
+# record their access time in batches of `touch_batch`, not one write per read.
+class ExplanationCache:
+    def __init__(self, path=None, ttl=30 * 24 * 3600, max_entries=10000, memory_entries=512, touch_batch=64):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.memory_entries = memory_entries
+        self.touch_batch = touch_batch
+        self.hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()   # key -> (value, created)
+        self._touched = {}             # key -> access time not yet written to disk
+        self._high_water = max_entries + max(1, max_entries // 10)
+        self._disk_rows = 0            # Rows on disk as of the last count, plus our inserts since
+        self._lock = threading.Lock()
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS explanations ("
+                "key TEXT PRIMARY KEY, model TEXT, value TEXT, created REAL, accessed REAL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS explanations_accessed ON explanations (accessed)")
+            self._db.commit()
+            self._disk_rows = self._db.execute("SELECT COUNT(*) FROM explanations").fetchone()[0]
+
+    def _expired(self, created, now):
+        return self.ttl is not None and now - created > self.ttl
+
+    # Return the cached text for (model, prompt) or None
+    def get(self, model, prompt):
+        key = prompt_key(model, prompt)
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if not self._expired(entry[1], now):
+                    self._memory.move_to_end(key)
+                    self._touch(key, now)
+                    self.hits += 1
+                    return entry[0]
+                del self._memory[key]
+
+            if self._db is not None:
+                # The disk store is shared between processes; a locked or broken
+                # database only costs a miss, never the request
+                try:
+                    row = self._db.execute(
+                        "SELECT value, created FROM explanations WHERE key = ?", (key,)
+                    ).fetchone()
+                    if row is not None:
+                        if not self._expired(row[1], now):
+                            self._touch(key, now)
+                            self._remember(key, row[0], row[1])
+                            self.hits += 1
+                            return row[0]
+                        self._db.execute("DELETE FROM explanations WHERE key = ?", (key,))
+                        self._db.commit()
+                except sqlite3.Error:
+                    self._db.rollback()
+
+            self.misses += 1
+            return None
+
+    # Store the text for (model, prompt) and evict anything over the size limits
+    def put(self, model, prompt, value):
+        key = prompt_key(model, prompt)
+        now = time.time()
+        with self._lock:
+            self._remember(key, value, now)
+            if self._db is not None:
+                try:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO explanations (key, model, value, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                        (key, model, value, now, now)
+                    )
+                    self._disk_rows += 1
+                    self._write_touched()
+                    if self._disk_rows > self._high_water:
+                        self._evict(now)
+                    self._db.commit()
+                except sqlite3.Error:
+                    self._db.rollback()
+
+    def _remember(self, key, value, created):
+        self._memory[key] = (value, created)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    # Note a hit's access time for the disk store, memory hits included, so eviction
+    # sees how recently an entry was used rather than when it last left memory
+    def _touch(self, key, now):
+        if self._db is None:
+            return
+        self._touched[key] = now
+        if len(self._touched) >= self.touch_batch:
+            try:
+                self._write_touched()
+                self._db.commit()
+            except sqlite3.Error:
+                self._db.rollback()
+
+    def _write_touched(self):
+        if self._touched:
+            self._db.executemany("UPDATE explanations SET accessed = ? WHERE key = ?",
+                                 [(accessed, key) for key, accessed in self._touched.items()])
+            self._touched.clear()
+
+    # Other processes share the store, so the row count is refreshed here rather than trusted
+    def _evict(self, now):
+        if self.ttl is not None:
+            self._db.execute("DELETE FROM explanations WHERE created < ?", (now - self.ttl,))
+        self._db.execute(
+            "DELETE FROM explanations WHERE key IN ("
+            "SELECT key FROM explanations ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,)
+        )
+        self._disk_rows = self._db.execute("SELECT COUNT(*) FROM explanations").fetchone()[0]
+
+    # Drop every entry from both levels
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._touched.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM explanations")
+                self._db.commit()
+                self._disk_rows = 0
+
+    # Hit/miss counters plus current sizes
+    def stats(self):
+        with self._lock:
+            disk = self._db.execute("SELECT COUNT(*) FROM explanations").fetchone()[0] if self._db is not None else 0
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'memory_entries': len(self._memory),
+                'disk_entries': disk,
+            }
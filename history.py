@@ -0,0 +1,322 @@
+from uuid import uuid4
+import numpy as np
+import threading
+import argparse
+import operator
+import atexit
+import queue
+import json
+import time
+import os
+
+import metrics
+from registry import ORDERED_RULES
+from inputs import NUMBER_FIELDS, FLAG_FIELDS, FACT_COLUMNS
+
+# Append-only history of advice results for aggregate reporting.
+#
+# A history is a directory of segments, one per writer process, so several processes
+# can record into the same history. A segment holds one raw binary file per column,
+# appended in batches by a background thread, plus meta.json describing the columns
+# and the rule order of the per-rule matrices. Readers memory-map the files, so
+# aggregates run over NumPy arrays without loading records into Python objects.
+#
+#   ts           float64         time the advice was recorded (Unix seconds)
+#   district     int32           index into meta.json's districts, -1 if not given
+#   <fact>       bool/int32/f32  one column per household fact
+#   fired        bool (n, R)     rule fired, R = len(meta.json's rules)
+#   min_savings  int32 (n, R)    LKR/month, 0 where the rule didn't fire
+#   max_savings  int32 (n, R)
+
+def _fact_dtype(name):
+    if name in FLAG_FIELDS:
+        return np.dtype(np.bool_)
+    return np.dtype(np.int32) if isinstance(NUMBER_FIELDS[name]['step'], int) else np.dtype(np.float32)
+
+_STOP = object()
+
+# Records advice in the background: record() only queues, so the request path never
+# waits on disk. Records arriving while the queue is full are dropped and counted.
+class HistoryWriter:
+    def __init__(self, path, batch_size=1024, flush_interval=1.0, max_queue=100000):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._rules = [rule.name for rule in ORDERED_RULES]
+        self._rule_index = {name: j for j, name in enumerate(self._rules)}
+        self._open_segment()
+
+        self._closed = False
+        self._queue = queue.Queue(max_queue)
+        self._thread = threading.Thread(target=self._run, daemon=True, name="history-writer")
+        self._thread.start()
+        # Records still queued at exit would die with the daemon thread
+        atexit.register(self.close)
+
+    # Start a new, empty segment
+    def _open_segment(self):
+        self.segment = os.path.join(self.path, f"seg-{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}-{uuid4().hex[:8]}")
+        os.makedirs(self.segment)
+        self._rows = 0   # Rows fully written to every column
+        self._districts = {}
+        self._write_meta()
+
+    # Queue one advice result: the household facts, fired rule names and their
+    # (min, max) savings in LKR/month
+    def record(self, facts, fired, savings, district=None):
+        try:
+            self._queue.put_nowait((time.time(), dict(facts), list(fired), list(savings), district))
+        except queue.Full:
+            metrics.count('history.dropped')
+
+    # Block until everything queued so far is on disk
+    def flush(self):
+        self._queue.join()
+
+    # Write out everything queued and stop the thread; safe to call more than once
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._thread.join()
+
+    def _write_meta(self):
+        meta = {
+            'rules': self._rules,
+            'facts': {name: _fact_dtype(name).str for name in FACT_COLUMNS},
+            'districts': list(self._districts),
+        }
+        tmp = os.path.join(self.segment, 'meta.json.tmp')
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        os.replace(tmp, os.path.join(self.segment, 'meta.json'))
+
+    # Gather records into batches of up to batch_size, or whatever arrived within
+    # flush_interval of the first one, and append each batch
+    def _run(self):
+        stopping = False
+        while not stopping:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size and batch[-1] is not _STOP:
+                try:
+                    batch.append(self._queue.get(timeout=max(0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            if batch[-1] is _STOP:
+                stopping = True
+            records = [item for item in batch if item is not _STOP]
+            try:
+                if records:
+                    with metrics.span('history.write', records=len(records)):
+                        self._write(records)
+            except Exception:
+                metrics.count('history.dropped', len(records))
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    # A record goes in only if each fired rule is known and has a (min, max) pair of
+    # whole LKR within int32; a bad record is dropped on its own, not with its batch
+    def _valid(self, record):
+        _, _, fired, savings, _ = record
+        try:
+            ok = len(savings) == len(fired) and all(name in self._rule_index for name in fired) and all(
+                len(pair) == 2 and all(-2**31 <= operator.index(value) < 2**31 for value in pair) for pair in savings
+            )
+        except TypeError:
+            ok = False
+        if not ok:
+            metrics.count('history.dropped')
+        return ok
+
+    def _write(self, records):
+        records = [record for record in records if self._valid(record)]
+        if not records:
+            return
+        n, width = len(records), len(self._rules)
+        values = np.array([[facts.get(name, 0) for name in FACT_COLUMNS] for _, facts, *_ in records], dtype=np.float64)
+        columns = {'ts': np.array([ts for ts, *_ in records], dtype=np.float64)}
+        columns.update((name, values[:, k].astype(_fact_dtype(name))) for k, name in enumerate(FACT_COLUMNS))
+
+        # Flat (row, rule) positions of the fired rules, and their savings
+        cells, ranges, codes = [], [], []
+        new_district = False
+        rule_index = self._rule_index
+        for i, (_, _, fired, savings, district) in enumerate(records):
+            if district is None:
+                codes.append(-1)
+            else:
+                if district not in self._districts:
+                    self._districts[district] = len(self._districts)
+                    new_district = True
+                codes.append(self._districts[district])
+            offset = i * width
+            cells.extend([offset + rule_index[name] for name in fired])
+            ranges.extend(savings)
+        columns['district'] = np.array(codes, dtype=np.int32)
+        ranges = np.array(ranges, dtype=np.int32).reshape(-1, 2)
+        for name, cell_values in (('fired', True), ('min_savings', ranges[:, 0]), ('max_savings', ranges[:, 1])):
+            matrix = np.zeros((n, width), dtype=np.bool_ if name == 'fired' else np.int32)
+            matrix.flat[cells] = cell_values
+            columns[name] = matrix
+
+        # meta.json first, so every district code on disk can be resolved
+        if new_district:
+            self._write_meta()
+        self._append(columns, n)
+
+    # Append a batch to every column, or to none: a failed append (disk full, ...) is
+    # cut back to the last complete row, so row i stays the same record in every column.
+    # Should that fail too, later batches go to a new segment.
+    def _append(self, columns, n):
+        try:
+            for name, values in columns.items():
+                with open(os.path.join(self.segment, f"{name}.bin"), 'ab') as f:
+                    f.write(values.tobytes())
+        except Exception:
+            try:
+                for name, values in columns.items():
+                    file = os.path.join(self.segment, f"{name}.bin")
+                    if os.path.exists(file):
+                        os.truncate(file, self._rows * (values.nbytes // n))
+            except OSError:
+                self._open_segment()
+            raise
+        self._rows += n
+
+# Process-wide writer, configured from the environment like the metrics sinks
+_writer = None
+
+def open_history(path, **options):
+    global _writer
+    _writer = HistoryWriter(path, **options)
+    return _writer
+
+def record(facts, fired, savings, district=None):
+    if _writer is not None:
+        _writer.record(facts, fired, savings, district)
+
+if os.getenv("ADVISOR_HISTORY_PATH"):
+    open_history(os.getenv("ADVISOR_HISTORY_PATH"))
+
+# One segment as memory-mapped columns. Columns can differ in length after a crash
+# mid-append, so only rows present in every column are read.
+class Segment:
+    def __init__(self, path):
+        with open(os.path.join(path, 'meta.json'), encoding='utf-8') as f:
+            meta = json.load(f)
+        self.rules = meta['rules']
+        self.districts = meta['districts']
+        width = len(self.rules)
+        dtypes = {'ts': (np.dtype(np.float64), 1), 'district': (np.dtype(np.int32), 1),
+                  'fired': (np.dtype(np.bool_), width), 'min_savings': (np.dtype(np.int32), width),
+                  'max_savings': (np.dtype(np.int32), width)}
+        dtypes.update({name: (np.dtype(dtype), 1) for name, dtype in meta['facts'].items()})
+
+        files = {name: os.path.join(path, f"{name}.bin") for name in dtypes}
+        self.rows = min(
+            (os.path.getsize(file) if os.path.exists(file) else 0) // (dtype.itemsize * per_row)
+            for file, (dtype, per_row) in zip(files.values(), dtypes.values())
+        )
+        self.columns = {}
+        if self.rows:
+            for name, (dtype, per_row) in dtypes.items():
+                shape = (self.rows, per_row) if name in ('fired', 'min_savings', 'max_savings') else (self.rows,)
+                self.columns[name] = np.memmap(files[name], dtype=dtype, mode='r', shape=shape)
+
+    # Row mask for the query filters
+    def select(self, district=None, since=None):
+        mask = np.ones(self.rows, dtype=bool)
+        if district is not None:
+            code = self.districts.index(district) if district in self.districts else -2
+            mask &= self.columns['district'] == code
+        if since is not None:
+            mask &= self.columns['ts'] >= since
+        return mask
+
+def segments(path):
+    if not os.path.isdir(path):
+        return
+    for name in sorted(os.listdir(path)):
+        if os.path.exists(os.path.join(path, name, 'meta.json')):
+            segment = Segment(os.path.join(path, name))
+            if segment.rows:
+                yield segment
+
+# How often each rule fired: {rule: {'count', 'share'}}, most frequent first.
+# Optional filters: district name, since (Unix seconds).
+def rule_frequency(path, district=None, since=None):
+    counts = {}
+    records = 0
+    for segment in segments(path):
+        mask = segment.select(district, since)
+        records += int(mask.sum())
+        fired = segment.columns['fired'][mask].sum(axis=0)
+        for name, count in zip(segment.rules, fired.tolist()):
+            counts[name] = counts.get(name, 0) + count
+    return {name: {'count': count, 'share': round(count / records, 4) if records else 0.0}
+            for name, count in sorted(counts.items(), key=lambda item: -item[1])}
+
+# Distribution of the total estimated savings per household (LKR/month), overall or
+# for one rule: record count, sums, means and percentiles of the min and max ends
+def savings_distribution(path, rule=None, district=None, since=None, percentiles=(10, 50, 90, 99)):
+    low_parts, high_parts = [], []
+    for segment in segments(path):
+        mask = segment.select(district, since)
+        low, high = segment.columns['min_savings'][mask], segment.columns['max_savings'][mask]
+        if rule is not None:
+            if rule not in segment.rules:
+                continue
+            j = segment.rules.index(rule)
+            fired = segment.columns['fired'][mask, j]
+            low_parts.append(low[fired, j].astype(np.int64))
+            high_parts.append(high[fired, j].astype(np.int64))
+        else:
+            low_parts.append(low.sum(axis=1, dtype=np.int64))
+            high_parts.append(high.sum(axis=1, dtype=np.int64))
+
+    low = np.concatenate(low_parts) if low_parts else np.zeros(0, dtype=np.int64)
+    high = np.concatenate(high_parts) if high_parts else np.zeros(0, dtype=np.int64)
+    summary = {'records': int(low.size)}
+    for end, values in (('min', low), ('max', high)):
+        summary[f'total_{end}'] = int(values.sum())
+        summary[f'mean_{end}'] = round(float(values.mean()), 2) if values.size else 0.0
+        summary[f'percentiles_{end}'] = (
+            {str(p): float(v) for p, v in zip(percentiles, np.percentile(values, percentiles))} if values.size else {}
+        )
+    return summary
+
+# Records and total estimated savings per district ('' for records without one)
+def savings_by_district(path, since=None):
+    totals = {}
+    for segment in segments(path):
+        mask = segment.select(since=since)
+        codes = segment.columns['district'][mask]
+        low = segment.columns['min_savings'][mask].sum(axis=1, dtype=np.int64)
+        high = segment.columns['max_savings'][mask].sum(axis=1, dtype=np.int64)
+        for code in np.unique(codes).tolist():
+            rows = codes == code
+            name = segment.districts[code] if code >= 0 else ''
+            entry = totals.setdefault(name, {'records': 0, 'total_min': 0, 'total_max': 0})
+            entry['records'] += int(rows.sum())
+            entry['total_min'] += int(low[rows].sum())
+            entry['total_max'] += int(high[rows].sum())
+    return totals
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Aggregate report over a recorded advice history.")
+    parser.add_argument("path", nargs="?", default=os.getenv("ADVISOR_HISTORY_PATH"), help="history directory")
+    parser.add_argument("--district", help="only records for this district")
+    parser.add_argument("--rule", help="savings distribution for this rule only")
+    parser.add_argument("--since", type=float, help="only records from this Unix time on")
+    args = parser.parse_args()
+    if not args.path:
+        parser.error("a history directory is required (or set ADVISOR_HISTORY_PATH)")
+
+    print(json.dumps({
+        'rule_frequency': rule_frequency(args.path, args.district, args.since),
+        'savings': savings_distribution(args.path, args.rule, args.district, args.since),
+        'by_district': savings_by_district(args.path, args.since),
+    }, indent=2))
@@ -0,0 +1,135 @@
+# Input domains for the household form, shared by app.py and offline tools
+
+# Numeric inputs: keyword arguments passed straight to st.number_input
+NUMBER_FIELDS = {
+    'ac_hours': dict(min_value=0.0, max_value=24.0, step=0.1),
+    'fan_count': dict(min_value=0, max_value=10, step=1),
+    'fan_hours': dict(min_value=0.0, max_value=100.0, step=0.1),
+    'heater_hours': dict(min_value=0.0, max_value=24.0, step=0.1),
+    'rice_cooker_keep_warm': dict(min_value=0.0, max_value=24.0, step=0.1),
+    'fridge_age': dict(min_value=0, max_value=30, step=1),
+    'fridge_door_opens': dict(min_value=0, max_value=50, step=1),
+    'incandescent_count': dict(min_value=0, max_value=50, step=1),
+    'cfl_count': dict(min_value=0, max_value=50, step=1),
+    'lights_left_on': dict(min_value=0.0, max_value=24.0, step=0.1),
+    'iron_hours': dict(min_value=0.0, max_value=5.0, step=0.1),
+    'total_appliance_hours': dict(min_value=0.0, max_value=24.0, step=0.1),
+    'monthly_kwh': dict(min_value=0, max_value=2000, step=1),
+}
+
+# Yes/No inputs (checkboxes)
+FLAG_FIELDS = [
+    'has_ac', 'has_fans', 'windows_closed', 'has_water_heater', 'has_rice_cooker',
+    'peak_hour_use', 'unplug_habit',
+]
+
+# Every fact a household record provides
+FACT_COLUMNS = list(FLAG_FIELDS) + list(NUMBER_FIELDS)
+
+# Facts older records may lack; 0 means "unknown" (flat-rate savings are used)
+OPTIONAL_FIELDS = ['monthly_kwh']
+
+# Value of each fact a household leaves out: the form's own defaults (unticked,
+# minimum), used alike by the engine, the rule conditions and parse_record
+FACT_DEFAULTS = {name: False for name in FLAG_FIELDS}
+FACT_DEFAULTS.update((name, spec['min_value']) for name, spec in NUMBER_FIELDS.items())
+
+# Every value a field can take when stepped through its widget range
+def field_values(name):
+    if name in FLAG_FIELDS:
+        return [False, True]
+    spec = NUMBER_FIELDS[name]
+    steps = round((spec['max_value'] - spec['min_value']) / spec['step'])
+    if isinstance(spec['step'], int):
+        return [spec['min_value'] + i * spec['step'] for i in range(steps + 1)]
+    return [round(spec['min_value'] + i * spec['step'], 2) for i in range(steps + 1)]
+
+# Same checks the form runs before advice is generated; returns a list of messages
+def validate_facts(facts):
+    errors = []
+
+    # AC validation
+    if facts['has_ac'] and facts['ac_hours'] <= 0:
+        errors.append("Please enter valid AC hours (> 0) since you checked 'Do you have an AC?'.")
+    if facts['ac_hours'] > 0 and not facts['has_ac']:
+        errors.append("Please check 'Do you have an AC?' if entering AC hours.")
+
+    # Fan validation
+    if facts['has_fans'] and (facts['fan_count'] <= 0 or facts['fan_hours'] <= 0):
+        errors.append("Since you checked 'Do you have fans?', please enter both a valid fan count (>0) and valid fan hours (>0).")
+    if facts['fan_count'] > 0 and not facts['has_fans']:
+        errors.append("Please check 'Do you have fans?' if entering a fan count.")
+    if facts['fan_hours'] > 0 and not facts['has_fans']:
+        errors.append("Please check 'Do you have fans?' if entering fan hours.")
+
+    # Rice cooker validation
+    if facts['has_rice_cooker'] and facts['rice_cooker_keep_warm'] <= 0:
+        errors.append("Please enter valid rice cooker keep-warm hours (> 0) since you checked 'Do you have a rice cooker?'.")
+    if facts['rice_cooker_keep_warm'] > 0 and not facts['has_rice_cooker']:
+        errors.append("Please check 'Do you have a rice cooker?' if entering keep-warm hours.")
+
+    # Peak hour validation
+    if facts['peak_hour_use'] and facts['total_appliance_hours'] <= 0:
+        errors.append("Please enter valid peak appliance hours (> 0) since you checked 'Use high-power appliances in peak hours?'.")
+    if facts['total_appliance_hours'] > 0 and not facts['peak_hour_use']:
+        errors.append("Please check 'Use high-power appliances in peak hours?' if entering peak appliance hours.")
+
+    # Water heater validation
+    if facts['has_water_heater'] and facts['heater_hours'] <= 0:
+        errors.append("Please enter valid water heater hours (> 0) since you checked 'Do you have a water heater?'.")
+    if facts['heater_hours'] > 0 and not facts['has_water_heater']:
+        errors.append("Please check 'Do you have a water heater?' if entering heater hours.")
+
+    return errors
+
+# Facts for the expert system, with peak hours estimated from appliance use when not given
+def build_facts(form):
+    facts = dict(form)
+    computed_peak_hours = 0.0
+    if facts['peak_hour_use']:
+        computed_peak_hours += facts['ac_hours'] if facts['has_ac'] else 0
+        computed_peak_hours += facts['iron_hours']
+        computed_peak_hours += facts['heater_hours'] if facts['has_water_heater'] else 0
+
+    if facts['total_appliance_hours'] <= 0:
+        facts['total_appliance_hours'] = computed_peak_hours
+    return facts
+
+_TRUE = {'1', 'true', 'yes', 'y', 't'}
+_FALSE = {'0', 'false', 'no', 'n', 'f', ''}
+
+# Parse an untyped record (CSV strings or JSON values) into form values.
+# Missing fields take the form defaults; returns (form, errors).
+def parse_record(record):
+    form = {}
+    errors = []
+    for name in FLAG_FIELDS:
+        value = record.get(name)
+        if value is None or isinstance(value, bool):
+            form[name] = bool(value)
+        elif str(value).strip().lower() in _TRUE:
+            form[name] = True
+        elif str(value).strip().lower() in _FALSE:
+            form[name] = False
+        else:
+            errors.append(f"Invalid yes/no value for '{name}': {value!r}.")
+
+    for name, spec in NUMBER_FIELDS.items():
+        value = record.get(name)
+        if value is None or (isinstance(value, str) and not value.strip()):
+            value = spec['min_value']
+        try:
+            number = float(value)
+        except (TypeError, ValueError):
+            errors.append(f"Invalid number for '{name}': {value!r}.")
+            continue
+        if isinstance(spec['step'], int):
+            if not number.is_integer():
+                errors.append(f"'{name}' must be a whole number.")
+                continue
+            number = int(number)
+        if not spec['min_value'] <= number <= spec['max_value']:
+            errors.append(f"'{name}' must be between {spec['min_value']} and {spec['max_value']}.")
+            continue
+        form[name] = number
+    return form, errors
@@ -0,0 +1,80 @@
+from dotenv import load_dotenv
+import threading
+import os
+load_dotenv()
+
+# LLM settings. Importing this module is cheap: huggingface_hub and requests are
+# only imported, and the client only built, on the first call to get_client().
+HF_TOKEN = os.getenv("HF_TOKEN")
+MODEL = "meta-llama/Meta-Llama-3-8B-Instruct"
+
+# Concurrency limit and per-call timeout (seconds) for the rephrasing stage
+MAX_CONCURRENCY = int(os.getenv("ADVISOR_LLM_CONCURRENCY", "8"))
+CALL_TIMEOUT = float(os.getenv("ADVISOR_LLM_TIMEOUT", "20"))
+
+# Builds the Hugging Face Inference API client. One keep-alive connection pool is
+# shared by every rephrasing thread, so the TLS handshake is paid once per process
+# instead of once per worker thread. huggingface_hub asks the backend factory for a
+# Session per thread, as Sessions aren't thread-safe; each gets its own Session with
+# the shared adapter (whose urllib3 pool is) mounted.
+def huggingface_client(model=MODEL, token=HF_TOKEN, timeout=CALL_TIMEOUT, pool_size=max(10, MAX_CONCURRENCY * 2)):
+    from huggingface_hub import InferenceClient
+    from requests.adapters import HTTPAdapter
+    import requests
+
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+
+    def http_session():
+        session = requests.Session()
+        session.mount("https://", adapter)
+        return session
+
+    try:
+        from huggingface_hub import configure_http_backend
+        configure_http_backend(backend_factory=http_session)
+    except ImportError:
+        # huggingface_hub without a pluggable requests backend keeps its own pooling
+        pass
+    return InferenceClient(model=model, token=token, timeout=timeout)
+
+# Async client for asyncio callers (service.py); its HTTP pool is managed by huggingface_hub
+def huggingface_async_client(model=MODEL, token=HF_TOKEN, timeout=CALL_TIMEOUT):
+    from huggingface_hub import AsyncInferenceClient
+    return AsyncInferenceClient(model=model, token=token, timeout=timeout)
+
+# The client is anything with InferenceClient's chat_completion(messages, **kwargs);
+# set_client() swaps in another provider, e.g. a local stand-in for benchmarks
+_client = None
+_client_lock = threading.Lock()
+
+def get_client():
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = huggingface_client()
+    return _client
+
+# Install a client and return the previous one (None if none was built yet)
+def set_client(client):
+    global _client
+    with _client_lock:
+        previous, _client = _client, client
+    return previous
+
+# Same as get_client/set_client for the async client, whose chat_completion is a coroutine
+_async_client = None
+
+def get_async_client():
+    global _async_client
+    if _async_client is None:
+        with _client_lock:
+            if _async_client is None:
+                _async_client = huggingface_async_client()
+    return _async_client
+
+def set_async_client(client):
+    global _async_client
+    with _client_lock:
+        previous, _async_client = _async_client, client
+    return previous
@@ -0,0 +1,197 @@
+from contextlib import contextmanager
+import threading
+import json
+import time
+import os
+
+# Tracing spans and counters for the advice pipeline. Nothing is recorded until a
+# sink is added, and while there are none span() returns a shared no-op object.
+_sinks = []
+_sinks_lock = threading.Lock()
+
+def add_sink(sink):
+    with _sinks_lock:
+        _sinks.append(sink)
+    return sink
+
+def remove_sink(sink):
+    with _sinks_lock:
+        _sinks.remove(sink)
+
+def enabled():
+    return bool(_sinks)
+
+def _emit(event):
+    for sink in _sinks:
+        sink.record(event)
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **labels):
+        pass
+
+NULL_SPAN = _NullSpan()
+
+# Times a block and emits one 'span' event; outcome is 'error' if the block raised
+class Span:
+    __slots__ = ('name', 'labels', 'start')
+
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        seconds = time.perf_counter() - self.start
+        if exc_type is not None:
+            self.labels['outcome'] = 'error'
+        self.labels.setdefault('outcome', 'ok')
+        _emit({'type': 'span', 'name': self.name, 'seconds': seconds, 'labels': self.labels, 'ts': time.time()})
+        return False
+
+    # Attach or override labels before the span ends (e.g. outcome='empty')
+    def set(self, **labels):
+        self.labels.update(labels)
+
+def span(name, **labels):
+    if not _sinks:
+        return NULL_SPAN
+    return Span(name, labels)
+
+def count(name, value=1, **labels):
+    if _sinks:
+        _emit({'type': 'counter', 'name': name, 'value': value, 'labels': labels, 'ts': time.time()})
+
+# Appends every event as one JSON object per line
+class JsonLinesSink:
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def record(self, event):
+        line = json.dumps(event, separators=(',', ':')) + '\n'
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+def _metric_name(name):
+    return 'advisor_' + name.replace('.', '_').replace('-', '_')
+
+def _label_text(labels):
+    if not labels:
+        return ''
+    parts = []
+    for key, value in labels:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        parts.append(f'{key}="{value}"')
+    return '{' + ','.join(parts) + '}'
+
+# Aggregates events in memory and renders them in the Prometheus text format:
+# counters become <name>_total, spans become <name>_seconds histograms
+class PrometheusSink:
+    BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}   # (name, labels) -> value
+        self._spans = {}      # (name, labels) -> [bucket counts..., count, sum]
+
+    def record(self, event):
+        key = (event['name'], tuple(sorted(event['labels'].items())))
+        with self._lock:
+            if event['type'] == 'counter':
+                self._counters[key] = self._counters.get(key, 0) + event['value']
+                return
+            stats = self._spans.get(key)
+            if stats is None:
+                stats = self._spans[key] = [0] * (len(self.BUCKETS) + 2)
+            for i, bound in enumerate(self.BUCKETS):
+                if event['seconds'] <= bound:
+                    stats[i] += 1
+            stats[-2] += 1
+            stats[-1] += event['seconds']
+
+    def render(self):
+        lines = []
+        with self._lock:
+            for name in sorted({name for name, _ in self._counters}):
+                metric = _metric_name(name) + '_total'
+                lines.append(f"# TYPE {metric} counter")
+                for (key_name, labels), value in sorted(self._counters.items()):
+                    if key_name == name:
+                        lines.append(f"{metric}{_label_text(labels)} {value}")
+            for name in sorted({name for name, _ in self._spans}):
+                metric = _metric_name(name) + '_seconds'
+                lines.append(f"# TYPE {metric} histogram")
+                for (key_name, labels), stats in sorted(self._spans.items()):
+                    if key_name != name:
+                        continue
+                    for bound, bucket in zip(self.BUCKETS, stats):
+                        lines.append(f"{metric}_bucket{_label_text(labels + (('le', bound),))} {bucket}")
+                    lines.append(f"{metric}_bucket{_label_text(labels + (('le', '+Inf'),))} {stats[-2]}")
+                    lines.append(f"{metric}_count{_label_text(labels)} {stats[-2]}")
+                    lines.append(f"{metric}_sum{_label_text(labels)} {stats[-1]:.6f}")
+        return '\n'.join(lines) + '\n'
+
+# Serve a PrometheusSink on http://<host>:<port>/metrics from a daemon thread
+def start_http_server(sink, port, host=''):
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = sink.render().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True, name='metrics-http').start()
+    return server
+
+# cProfile capture: with ADVISOR_PROFILE_DIR set, each profiled block writes a .prof file
+PROFILE_DIR = os.getenv("ADVISOR_PROFILE_DIR")
+
+@contextmanager
+def profiled(name):
+    if not PROFILE_DIR:
+        yield
+        return
+    import cProfile
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        profiler.dump_stats(os.path.join(PROFILE_DIR, f"{name}-{time.strftime('%Y%m%d-%H%M%S')}-{threading.get_ident()}.prof"))
+
+# Sinks configured from the environment, so the pipeline can be traced without code changes
+if os.getenv("ADVISOR_METRICS_JSONL"):
+    add_sink(JsonLinesSink(os.getenv("ADVISOR_METRICS_JSONL")))
+if os.getenv("ADVISOR_METRICS_PORT"):
+    start_http_server(add_sink(PrometheusSink()), int(os.getenv("ADVISOR_METRICS_PORT")))
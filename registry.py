@@ -0,0 +1,52 @@
+from rules import RULES, UI_CATEGORY_ORDER
+
+# Compact, read-only view of one entry in rules.RULES plus its UI sort rank
+class RuleRecord:
+    __slots__ = ('name', 'facts', 'condition', 'test', 'vector_condition', 'savings', 'vector_savings',
+                 'recommendation', 'explanation', 'confidence', 'polish', 'rank')
+
+    def __init__(self, rule, rank):
+        self.name = rule['name']
+        self.facts = tuple(rule.get('facts', ()))
+        self.condition = rule['condition']
+        self.test = rule['test']                          # Condition taking the facts as named arguments
+        self.vector_condition = rule['vector_condition']  # Condition over a dict of fact columns
+        self.savings = rule['savings']
+        self.vector_savings = rule['vector_savings']      # Callable savings over fact columns, None if fixed
+        self.recommendation = rule['recommendation']
+        self.explanation = rule['explanation']
+        self.confidence = rule['confidence']
+        self.polish = rule.get('polish', True)   # False: never worth an LLM call
+        self.rank = rank
+
+    def __repr__(self):
+        return f"RuleRecord({self.name!r}, rank={self.rank})"
+
+# Rules missing from the UI order are shown last
+UNRANKED = len(UI_CATEGORY_ORDER)
+_UI_RANK = {name: rank for rank, name in enumerate(UI_CATEGORY_ORDER)}
+
+# Built once at import: rule name -> RuleRecord
+RULE_INDEX = {}
+for _rule in RULES:
+    if _rule['name'] in RULE_INDEX:
+        raise ValueError(f"Duplicate rule name in RULES: {_rule['name']}")
+    RULE_INDEX[_rule['name']] = RuleRecord(_rule, _UI_RANK.get(_rule['name'], UNRANKED))
+del _rule
+
+# Every record in UI order (rules without a rank keep their RULES order)
+ORDERED_RULES = tuple(sorted(RULE_INDEX.values(), key=lambda record: record.rank))
+
+# Fact name -> names of the rules whose result can change with it. Every rule's
+# savings are re-priced from monthly_kwh, so it maps to all of them.
+RULES_BY_FACT = {}
+for _record in ORDERED_RULES:
+    for _fact in _record.facts + ('monthly_kwh',):
+        RULES_BY_FACT.setdefault(_fact, []).append(_record.name)
+RULES_BY_FACT = {fact: tuple(names) for fact, names in RULES_BY_FACT.items()}
+del _record, _fact
+
+# UI sort rank for a rule name
+def ui_rank(name):
+    record = RULE_INDEX.get(name)
+    return record.rank if record is not None else UNRANKED
@@ -0,0 +1,331 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeoutError
+from cache import ExplanationCache, prompt_key
+from templates import load_templates
+from postprocess import clean_reply, finalize, missing_figures
+from registry import RULE_INDEX
+from llm import MODEL, MAX_CONCURRENCY, CALL_TIMEOUT, get_client, get_async_client
+import metrics
+import asyncio
+import json
+import math
+import os
+import re
+import time
+
+# 'per_rule' sends one chat completion per explanation; 'batched' sends all of a
+# household's explanations in one prompt and asks for a JSON array back
+REPHRASE_MODES = ('per_rule', 'batched')
+REPHRASE_MODE = os.getenv("ADVISOR_REPHRASE_MODE", "per_rule")
+
+# Rendering policy, i.e. how long explanations wait for the LLM:
+#  'template' - never call it; pre-rendered or cached text, else the deterministic text
+#  'deadline' - call it, but only use replies arriving within LLM_DEADLINE_MS in total
+#  'always'   - wait for every call up to its timeout
+RENDER_POLICIES = ('template', 'deadline', 'always')
+RENDER_POLICY = os.getenv("ADVISOR_RENDER_POLICY", "always")
+LLM_DEADLINE_MS = float(os.getenv("ADVISOR_LLM_DEADLINE_MS", "1500"))
+
+# Rules never sent to the LLM, on top of those marked "polish": False in rules.py
+NO_POLISH_RULES = frozenset(name for name in os.getenv("ADVISOR_NO_POLISH_RULES", "").split(",") if name)
+
+# Rephrased explanations are cached on disk; set ADVISOR_CACHE_PATH="" for memory only
+cache = ExplanationCache(
+    path=os.getenv("ADVISOR_CACHE_PATH", ".advisor_cache.sqlite3") or None,
+    ttl=float(os.getenv("ADVISOR_CACHE_TTL", str(30 * 24 * 3600))),
+    max_entries=int(os.getenv("ADVISOR_CACHE_MAX_ENTRIES", "10000")),
+)
+
+# Explanations pre-rendered by `python templates.py`, looked up before the cache
+templates = load_templates()
+
+# Build the rephrasing prompt for one fired rule
+def build_prompt(raw, savings_str, confidence):
+    return f"Rephrase the following into 1-2 natural sentences. Use **LKR** only (never 'dollars', 'units', or 'kWh'). Include exact savings: ~LKR {savings_str}/month and confidence: {confidence}%.\nInput: {raw}"
+
+# Prompt for one job; jobs are dicts with 'raw', 'savings_str', 'confidence' and
+# optionally the rule's 'name'
+def job_prompt(job):
+    return build_prompt(job['raw'], job['savings_str'], job['confidence'])
+
+# Whether a job's explanation is worth an LLM call. Jobs without a rule name always are.
+def wants_llm(job):
+    name = job.get('name')
+    if name is None:
+        return True
+    rule = RULE_INDEX.get(name)
+    return name not in NO_POLISH_RULES and (rule is None or rule.polish)
+
+# Build one prompt covering several fired rules; the reply must be a JSON array
+# holding one rephrased explanation per item, in item order
+def build_batch_prompt(jobs):
+    items = '\n'.join(
+        f"{n}. {job['raw']} [Savings: ~LKR {job['savings_str']}/month, confidence: {job['confidence']}%]"
+        for n, job in enumerate(jobs, start=1)
+    )
+    return f"Rephrase each of the {len(jobs)} numbered items below into 1-2 natural sentences. Use **LKR** only (never 'dollars', 'units', or 'kWh'). Include each item's exact savings and confidence. Reply with only a JSON array of {len(jobs)} strings, in the same order as the items.\n{items}"
+
+# Deterministic text used when the LLM fails, times out or returns nothing
+def fallback_text(raw, savings_str, confidence):
+    return f"{raw} (Savings: ~LKR {savings_str}/month, Confidence: {confidence}%)"
+
+# Reply text of a chat completion, None if empty. Token usage, when the API
+# reports it, is counted per rephrasing mode.
+def _reply_text(response, span, mode):
+    content = response.choices[0].message.content.strip() or None
+    if content is None:
+        span.set(outcome='empty')
+    usage = getattr(response, 'usage', None)
+    if usage is not None:
+        metrics.count('llm.tokens', usage.prompt_tokens or 0, kind='prompt', mode=mode)
+        metrics.count('llm.tokens', usage.completion_tokens or 0, kind='completion', mode=mode)
+    return content
+
+# Single blocking chat completion, returns None on an empty reply
+def _complete(prompt, mode='per_rule'):
+    with metrics.span('llm.call', mode=mode) as span:
+        response = get_client().chat_completion(messages=[{"role": "user", "content": prompt}])
+        return _reply_text(response, span, mode)
+
+# Non-blocking chat completion for asyncio callers, returns None on an empty reply
+async def _complete_async(prompt, mode='per_rule'):
+    with metrics.span('llm.call', mode=mode) as span:
+        response = await get_async_client().chat_completion(messages=[{"role": "user", "content": prompt}])
+        return _reply_text(response, span, mode)
+
+# Pre-rendered template or cached reply for a prompt, or None
+def _lookup(prompt, use_templates=True):
+    reply = templates.get(prompt_key(MODEL, prompt)) if use_templates else None
+    if reply is not None:
+        metrics.count('rephrase.lookup', source='template')
+        return reply
+    reply = cache.get(MODEL, prompt)
+    metrics.count('rephrase.lookup', source='cache' if reply is not None else 'miss')
+    return reply
+
+# Yield (index, cleaned reply) for each prompt as soon as its reply is available.
+# Pre-rendered templates are tried first, then the cache; only misses go to the
+# Inference API, concurrently. Prompts whose call fails or times out are skipped.
+def iter_replies(prompts, max_concurrency=MAX_CONCURRENCY, timeout=CALL_TIMEOUT, use_templates=True):
+    pending = []
+    for i, prompt in enumerate(prompts):
+        reply = _lookup(prompt, use_templates)
+        if reply is None:
+            pending.append(i)
+        else:
+            yield i, reply
+    yield from _iter_calls(prompts, pending, max_concurrency, timeout)
+
+# Send prompts[i] for every i in pending concurrently, yielding (i, cleaned reply)
+# as calls complete and caching each reply
+def _iter_calls(prompts, pending, max_concurrency, timeout, budget=None):
+    if not pending:
+        return
+
+    workers = max(1, min(max_concurrency, len(pending)))
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="rephrase")
+    futures = {executor.submit(_complete, prompts[i]): i for i in pending}
+
+    # Calls run in waves of `workers`, each wave gets one timeout budget, unless
+    # the caller gives one budget (seconds) for them all
+    if budget is None:
+        budget = timeout * math.ceil(len(pending) / workers)
+    deadline = time.monotonic() + budget
+    finished = 0
+    try:
+        for future in as_completed(futures, timeout=max(0, deadline - time.monotonic())):
+            finished += 1
+            try:
+                content = future.result()
+            except Exception:
+                content = None
+            if content:
+                content = clean_reply(content)
+                cache.put(MODEL, prompts[futures[future]], content)
+                yield futures[future], content
+    # Not the builtin TimeoutError before Python 3.11
+    except FuturesTimeoutError:
+        metrics.count('llm.timeout', len(pending) - finished)
+    finally:
+        # Don't let a hung call hold up the page; its result is discarded
+        executor.shutdown(wait=False, cancel_futures=True)
+
+_JSON_ARRAY = re.compile(r"\[.*\]", re.S)
+
+# Split a batched reply into one cleaned explanation per job, None where an item is
+# missing or malformed. The array must hold exactly one string per job, otherwise
+# items can't be matched to jobs and all are rejected; an item mentioning neither
+# its savings nor its confidence is taken to belong to another job.
+def parse_batch_reply(content, jobs):
+    replies = [None] * len(jobs)
+    match = _JSON_ARRAY.search(content or '')
+    if not match:
+        return replies
+    try:
+        items = json.loads(match.group())
+    except ValueError:
+        return replies
+    if not isinstance(items, list) or len(items) != len(jobs):
+        return replies
+    for i, (item, job) in enumerate(zip(items, jobs)):
+        if not isinstance(item, str) or not item.strip():
+            continue
+        item = clean_reply(item)
+        if missing_figures(item, job['savings_str'], job['confidence']) != (True, True):
+            replies[i] = item
+    return replies
+
+# Send every pending job in one batched chat completion. Items the reply leaves out
+# or garbles go through the per-rule path, unless the batched call timed out, in
+# which case they are skipped like any other timed-out prompt.
+def _iter_batched(jobs, prompts, pending, max_concurrency, timeout, budget=None):
+    start = time.monotonic()
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rephrase")
+    future = executor.submit(_complete, build_batch_prompt([jobs[i] for i in pending]), 'batched')
+    timed_out = False
+    try:
+        content = future.result(timeout=timeout if budget is None else budget)
+    except FuturesTimeoutError:
+        metrics.count('llm.timeout')
+        content, timed_out = None, True
+    except Exception:
+        content = None
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    retry = []
+    for i, reply in zip(pending, parse_batch_reply(content, [jobs[i] for i in pending])):
+        if reply is None:
+            retry.append(i)
+        else:
+            cache.put(MODEL, prompts[i], reply)
+            yield i, reply
+    metrics.count('rephrase.batch_items', len(pending) - len(retry), outcome='ok')
+    metrics.count('rephrase.batch_items', len(retry), outcome='invalid')
+    if not timed_out:
+        if budget is not None:
+            budget = max(0, budget - (time.monotonic() - start))
+        yield from _iter_calls(prompts, retry, max_concurrency, timeout, budget)
+
+def _settings(mode, policy):
+    mode = mode or REPHRASE_MODE
+    policy = policy or RENDER_POLICY
+    if mode not in REPHRASE_MODES:
+        raise ValueError(f"Unknown rephrasing mode {mode!r}, expected one of {REPHRASE_MODES}")
+    if policy not in RENDER_POLICIES:
+        raise ValueError(f"Unknown rendering policy {policy!r}, expected one of {RENDER_POLICIES}")
+    return mode, policy
+
+# (index, reply) pairs for jobs with a pre-rendered or cached reply, and the indexes
+# of the others that should still go to the LLM under `policy`
+def _lookup_jobs(jobs, prompts, policy):
+    found = []
+    pending = []
+    for i, prompt in enumerate(prompts):
+        reply = _lookup(prompt)
+        if reply is not None:
+            found.append((i, reply))
+        elif policy != 'template' and wants_llm(jobs[i]):
+            pending.append(i)
+    metrics.count('rephrase.skipped', len(jobs) - len(found) - len(pending), policy=policy)
+    return found, pending
+
+# (index, cleaned reply) for each job as replies arrive, under the given rephrasing
+# mode and rendering policy. Templates and the cache are tried first for every job;
+# only misses for rules worth polishing go to the LLM.
+def iter_job_replies(jobs, max_concurrency=MAX_CONCURRENCY, timeout=CALL_TIMEOUT, mode=None, policy=None):
+    mode, policy = _settings(mode, policy)
+    prompts = [job_prompt(job) for job in jobs]
+    found, pending = _lookup_jobs(jobs, prompts, policy)
+    yield from found
+
+    budget = LLM_DEADLINE_MS / 1000 if policy == 'deadline' else None
+    if mode == 'batched' and len(pending) >= 2:
+        yield from _iter_batched(jobs, prompts, pending, max_concurrency, timeout, budget)
+    else:
+        yield from _iter_calls(prompts, pending, max_concurrency, timeout, budget)
+
+# Async counterpart of iter_job_replies for event-loop callers. All calls share one
+# `deadline` (seconds for the whole job list, shortened to LLM_DEADLINE_MS under the
+# 'deadline' policy); `limiter` is an optional semaphore shared with other requests
+# to cap concurrent calls process-wide.
+async def iter_job_replies_async(jobs, max_concurrency=MAX_CONCURRENCY, deadline=CALL_TIMEOUT, mode=None, limiter=None,
+                                 policy=None):
+    mode, policy = _settings(mode, policy)
+    if policy == 'deadline':
+        deadline = min(deadline, LLM_DEADLINE_MS / 1000)
+    end = time.monotonic() + deadline
+    prompts = [job_prompt(job) for job in jobs]
+    # The cache is SQLite; its reads and writes run in threads to keep the loop free
+    found, pending = await asyncio.to_thread(_lookup_jobs, jobs, prompts, policy)
+    for i, reply in found:
+        yield i, reply
+    limiter = limiter or asyncio.Semaphore(max_concurrency)
+
+    if mode == 'batched' and len(pending) >= 2:
+        try:
+            async with limiter:
+                content = await asyncio.wait_for(
+                    _complete_async(build_batch_prompt([jobs[i] for i in pending]), 'batched'),
+                    max(0, end - time.monotonic()))
+        # Not the builtin TimeoutError before Python 3.11
+        except asyncio.TimeoutError:
+            metrics.count('llm.timeout')
+            return
+        except Exception:
+            content = None
+        retry = []
+        for i, reply in zip(pending, parse_batch_reply(content, [jobs[i] for i in pending])):
+            if reply is None:
+                retry.append(i)
+            else:
+                await asyncio.to_thread(cache.put, MODEL, prompts[i], reply)
+                yield i, reply
+        metrics.count('rephrase.batch_items', len(pending) - len(retry), outcome='ok')
+        metrics.count('rephrase.batch_items', len(retry), outcome='invalid')
+        pending = retry
+    if not pending:
+        return
+
+    async def call(i):
+        try:
+            async with limiter:
+                return i, await _complete_async(prompts[i])
+        except Exception:
+            return i, None
+
+    tasks = [asyncio.create_task(call(i)) for i in pending]
+    finished = 0
+    try:
+        for next_reply in asyncio.as_completed(tasks, timeout=max(0, end - time.monotonic())):
+            i, content = await next_reply
+            finished += 1
+            if content:
+                content = clean_reply(content)
+                await asyncio.to_thread(cache.put, MODEL, prompts[i], content)
+                yield i, content
+    except asyncio.TimeoutError:
+        metrics.count('llm.timeout', len(pending) - finished)
+    finally:
+        for task in tasks:
+            task.cancel()
+
+# Cleaned LLM reply for each prompt, in order, or None where the call failed
+def fetch_replies(prompts, max_concurrency=MAX_CONCURRENCY, timeout=CALL_TIMEOUT, use_templates=True):
+    replies = [None] * len(prompts)
+    for i, content in iter_replies(prompts, max_concurrency, timeout, use_templates):
+        replies[i] = content
+    return replies
+
+# Final explanation text for a job: the LLM reply, or the fallback when there is none
+def polish(job, content):
+    if not content:
+        content = fallback_text(job['raw'], job['savings_str'], job['confidence'])
+    return finalize(content, job['savings_str'], job['confidence'])
+
+# Rephrase every job; output order always matches the job order
+def rephrase_all(jobs, max_concurrency=MAX_CONCURRENCY, timeout=CALL_TIMEOUT, mode=None, policy=None):
+    replies = [None] * len(jobs)
+    for i, content in iter_job_replies(jobs, max_concurrency, timeout, mode, policy):
+        replies[i] = content
+    metrics.count('advice.fallback', sum(1 for content in replies if not content))
+    return [polish(job, content) for job, content in zip(jobs, replies)]
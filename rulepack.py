@@ -0,0 +1,245 @@
+import importlib.util
+import argparse
+import hashlib
+import marshal
+import json
+import os
+
+from inputs import FACT_DEFAULTS, FLAG_FIELDS
+
+# Rule packs: the rules declared once as data and compiled at load time into the
+# forms the rest of the advisor uses.
+#
+# A pack is a JSON file with "ui_order" (rule names in display order) and "rules",
+# each rule having:
+#   name, recommendation, explanation, confidence, polish (optional, default true)
+#   when     condition over the household facts, e.g. "has_ac and ac_hours >= 5":
+#            comparisons and yes/no facts combined with and/or/not
+#   savings  [min, max] LKR/month at the flat rate, each a whole number or a formula
+#            over the facts using + - * /, max(), min() and int(); formulas are
+#            truncated to whole LKR, as the batch arrays hold integers
+#
+# Each rule compiles to a condition on a facts dict (facts the household left out
+# take the form defaults), a TEST for the experta engine taking the facts by name,
+# and NumPy forms of the condition and savings for batch evaluation. The compiled
+# code is cached on disk keyed by a hash of the pack, so a pack is parsed and
+# checked only the first time it is loaded.
+
+RULE_PACK_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "rulepacks")
+DEFAULT_RULE_PACK = os.getenv("ADVISOR_RULE_PACK", "default")
+# Directory for compiled packs, next to this module: the cached code is executed, so it
+# must not live anywhere others can write. Set ADVISOR_RULE_CACHE_DIR="" to always compile.
+RULE_CACHE_DIR = os.getenv("ADVISOR_RULE_CACHE_DIR",
+                           os.path.join(os.path.dirname(os.path.abspath(__file__)), ".advisor_rule_cache"))
+
+# Bump when the generated code changes, so cached packs are recompiled
+_COMPILER_VERSION = 2
+
+# NumPy stand-ins for max(), min() and int() in the generated batch functions.
+# NumPy is imported on first use, so loading rules doesn't import it.
+def _maximum(a, b):
+    import numpy as np
+    return np.maximum(a, b)
+
+def _minimum(a, b):
+    import numpy as np
+    return np.minimum(a, b)
+
+# Python's int() truncates towards zero
+def _trunc(values):
+    import numpy as np
+    return np.trunc(values).astype(np.int64)
+
+# `not` for a column or a plain bool; ~ on a bool gives -1 or -2, both true
+def _not(values):
+    import numpy as np
+    return np.logical_not(values)
+
+_COMPARE = {'Gt': '>', 'GtE': '>=', 'Lt': '<', 'LtE': '<=', 'Eq': '==', 'NotEq': '!='}
+_ARITHMETIC = {'Add': '+', 'Sub': '-', 'Mult': '*', 'Div': '/'}
+
+# Python source for one parsed expression, for one of three targets:
+#   'facts'  reads facts from a dict named `facts`, with the form defaults
+#   'named'  reads facts as plain variables (the experta TEST's parameters)
+#   'vector' reads fact columns from a dict of arrays named `c`
+# Fact names are appended to `used` in order of first appearance.
+def _emit(node, target, used):
+    import ast
+
+    def emit(child):
+        return _emit(child, target, used)
+
+    kind = type(node).__name__
+    if isinstance(node, ast.Constant) and type(node.value) in (bool, int, float):
+        return repr(node.value)
+    if isinstance(node, ast.Name):
+        if node.id not in FACT_DEFAULTS:
+            raise ValueError(f"unknown fact '{node.id}'")
+        if node.id not in used:
+            used.append(node.id)
+        if target == 'facts':
+            return f"facts.get({node.id!r}, {FACT_DEFAULTS[node.id]!r})"
+        return f"c[{node.id!r}]" if target == 'vector' else node.id
+    if isinstance(node, ast.BoolOp):
+        if target == 'vector':
+            op = ' & ' if isinstance(node.op, ast.And) else ' | '
+        else:
+            op = ' and ' if isinstance(node.op, ast.And) else ' or '
+        return '(' + op.join(emit(value) for value in node.values) + ')'
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+        return f"_not({emit(node.operand)})" if target == 'vector' else f"(not {emit(node.operand)})"
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub):
+        return f"(-{emit(node.operand)})"
+    if isinstance(node, ast.BinOp) and type(node.op).__name__ in _ARITHMETIC:
+        return f"({emit(node.left)} {_ARITHMETIC[type(node.op).__name__]} {emit(node.right)})"
+    if isinstance(node, ast.Compare) and all(type(op).__name__ in _COMPARE for op in node.ops):
+        # a < b < c becomes (a < b) and (b < c), which also works on arrays
+        operands = [node.left] + node.comparators
+        pairs = [f"({emit(left)} {_COMPARE[type(op).__name__]} {emit(right)})"
+                 for left, op, right in zip(operands, node.ops, operands[1:])]
+        return pairs[0] if len(pairs) == 1 else '(' + (' & ' if target == 'vector' else ' and ').join(pairs) + ')'
+    if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and not node.keywords:
+        name, args = node.func.id, [emit(arg) for arg in node.args]
+        if name in ('max', 'min') and len(args) >= 2:
+            if target != 'vector':
+                return f"{name}({', '.join(args)})"
+            result = args[-1]
+            for arg in reversed(args[:-1]):
+                result = f"{'_maximum' if name == 'max' else '_minimum'}({arg}, {result})"
+            return result
+        if name == 'int' and len(args) == 1:
+            return f"_trunc({args[0]})" if target == 'vector' else f"int({args[0]})"
+    raise ValueError(f"unsupported expression '{ast.unparse(node)}' ({kind})")
+
+# A condition must be true/false row by row: comparisons and yes/no facts joined
+# with and/or/not. Numbers used as truth values would break the NumPy form.
+def _check_condition(node):
+    import ast
+    if isinstance(node, ast.BoolOp):
+        for value in node.values:
+            _check_condition(value)
+    elif isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+        _check_condition(node.operand)
+    elif not (isinstance(node, ast.Compare) or (isinstance(node, ast.Name) and node.id in FLAG_FIELDS)):
+        raise ValueError(f"'{ast.unparse(node)}' is not a comparison or a yes/no fact")
+
+# Savings are amounts: comparisons and and/or/not belong in the condition
+def _check_amount(node):
+    import ast
+    for child in ast.walk(node):
+        if isinstance(child, (ast.Compare, ast.BoolOp)) or (isinstance(child, ast.UnaryOp) and isinstance(child.op, ast.Not)):
+            raise ValueError(f"'{ast.unparse(child)}' is a condition, savings must be amounts")
+
+def _parse(text):
+    import ast
+    try:
+        return ast.parse(str(text).strip(), mode='eval').body
+    except SyntaxError as exc:
+        raise ValueError(f"invalid expression {text!r}: {exc.msg}") from None
+
+# Python source of one rule's dict entry in RULES
+def _rule_source(rule):
+    missing = [key for key in ('name', 'when', 'recommendation', 'explanation', 'savings', 'confidence') if key not in rule]
+    if missing:
+        raise ValueError(f"missing {', '.join(missing)}")
+    if not isinstance(rule['savings'], list) or len(rule['savings']) != 2:
+        raise ValueError("savings must be a [min, max] pair")
+
+    when = _parse(rule['when'])
+    _check_condition(when)
+    used = []
+    condition = {target: _emit(when, target, used) for target in ('facts', 'named', 'vector')}
+    when_facts = list(used)
+
+    if all(type(end) is int for end in rule['savings']):
+        savings, vector_savings = repr(tuple(rule['savings'])), 'None'
+    elif any(not isinstance(end, (int, str)) or type(end) is bool for end in rule['savings']):
+        raise ValueError("savings must be whole numbers of LKR or formulas")
+    else:
+        ends = [_parse(end) for end in rule['savings']]
+        for end in ends:
+            _check_amount(end)
+        facts_ends = ', '.join(f"int({_emit(end, 'facts', used)})" for end in ends)
+        vector_ends = ', '.join(f"_trunc({_emit(end, 'vector', used)})" for end in ends)
+        savings, vector_savings = f"lambda facts: ({facts_ends})", f"lambda c: ({vector_ends})"
+
+    return (
+        f"    {{'name': {rule['name']!r}, 'facts': {tuple(used)!r},\n"
+        f"     'condition': lambda facts: {condition['facts']},\n"
+        f"     'test': lambda {', '.join(when_facts)}: {condition['named']},\n"
+        f"     'vector_condition': lambda c: {condition['vector']},\n"
+        f"     'savings': {savings},\n"
+        f"     'vector_savings': {vector_savings},\n"
+        f"     'recommendation': {rule['recommendation']!r}, 'explanation': {rule['explanation']!r},\n"
+        f"     'confidence': {int(rule['confidence'])!r}, 'polish': {bool(rule.get('polish', True))!r}}},\n"
+    )
+
+# Python source defining RULES and UI_ORDER for a parsed pack; ValueError names the
+# first rule that doesn't compile
+def pack_source(pack):
+    parts = [f"UI_ORDER = {list(pack.get('ui_order', []))!r}\n", "RULES = [\n"]
+    for i, rule in enumerate(pack['rules']):
+        try:
+            parts.append(_rule_source(rule))
+        except ValueError as exc:
+            raise ValueError(f"Rule '{rule.get('name', i)}': {exc}") from None
+    parts.append("]\n")
+    return ''.join(parts)
+
+def _pack_path(name):
+    return name if name.endswith('.json') else os.path.join(RULE_PACK_DIR, f"{name}.json")
+
+# Compiled code is only valid for this compiler, this Python and these fact defaults
+def _cache_key(data):
+    digest = hashlib.sha256(data)
+    digest.update(f"{_COMPILER_VERSION}\n{sorted(FACT_DEFAULTS.items())!r}\n".encode('utf-8'))
+    digest.update(importlib.util.MAGIC_NUMBER)
+    return digest.hexdigest()
+
+# Load a pack by name (rulepacks/<name>.json) or path to a .json file, returning
+# (rules, ui_order) with rules in the pack's order
+def load_rule_pack(name=DEFAULT_RULE_PACK, cache_dir=RULE_CACHE_DIR):
+    path = _pack_path(name)
+    with open(path, 'rb') as f:
+        data = f.read()
+
+    cache_path = os.path.join(cache_dir, f"{_cache_key(data)}.bin") if cache_dir else None
+    code = None
+    if cache_path and os.path.exists(cache_path):
+        try:
+            with open(cache_path, 'rb') as f:
+                code = marshal.loads(f.read())
+        except (OSError, EOFError, ValueError, TypeError):
+            code = None   # Unreadable entry: recompile and overwrite it
+
+    if code is None:
+        code = compile(pack_source(json.loads(data)), f"<rule pack {path}>", 'exec')
+        if cache_path:
+            try:
+                os.makedirs(cache_dir, exist_ok=True)
+                tmp = f"{cache_path}.{os.getpid()}.tmp"
+                with open(tmp, 'wb') as f:
+                    f.write(marshal.dumps(code))
+                os.replace(tmp, cache_path)
+            except OSError:
+                pass   # A read-only cache only costs the compile next time
+
+    namespace = {'_maximum': _maximum, '_minimum': _minimum, '_trunc': _trunc, '_not': _not}
+    exec(code, namespace)
+    return namespace['RULES'], namespace['UI_ORDER']
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check a rule pack and show what it compiles to.")
+    parser.add_argument("pack", nargs="?", default=DEFAULT_RULE_PACK, help="pack name in rulepacks/ or path to a .json file")
+    parser.add_argument("--source", action="store_true", help="print the generated Python instead of a summary")
+    args = parser.parse_args()
+
+    with open(_pack_path(args.pack), encoding='utf-8') as f:
+        source = pack_source(json.load(f))
+    if args.source:
+        print(source)
+    else:
+        rules, ui_order = load_rule_pack(args.pack, cache_dir=None)
+        for rule in rules:
+            print(f"{rule['name']}: reads {', '.join(rule['facts']) or 'nothing'}")
+        print(f"{len(rules)} rules, {len(ui_order)} in the UI order")
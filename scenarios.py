@@ -0,0 +1,151 @@
+import numpy as np
+import argparse
+import json
+
+import batch
+from inputs import NUMBER_FIELDS, FLAG_FIELDS, FACT_COLUMNS, OPTIONAL_FIELDS, validate_facts
+
+# What-if sweeps: vary a few inputs of one household over a grid and score every
+# combination at once with the batch engine, no LLM involved.
+#
+# A rule's savings are what the household could still save by following it, so a
+# scenario's saving is how much it lowers that remaining total compared with the
+# household as it is. A rule the change clears is credited only with what its
+# formula attributes to the change: AC_Usage_Reduction assumes cutting to 3-4h, so
+# 7h -> 4.9h saves the drop in its formula from 7h to 4.9h, not the whole range for
+# stepping under its 5h threshold. Fixed ranges, and formulas the change doesn't
+# move, are all or nothing.
+
+# Grid values for one input, checked against the form's limits
+def _grid_values(name, values):
+    if name in FLAG_FIELDS:
+        values = np.asarray(list(values), dtype=bool)
+    elif name in NUMBER_FIELDS:
+        spec = NUMBER_FIELDS[name]
+        values = np.asarray(list(values), dtype=np.int64 if isinstance(spec['step'], int) else np.float64)
+        outside = values[(values < spec['min_value']) | (values > spec['max_value'])]
+        if outside.size:
+            raise ValueError(f"'{name}' must be between {spec['min_value']} and {spec['max_value']}, got {outside[0]}.")
+    else:
+        raise ValueError(f"Unknown input '{name}'.")
+    if not values.size:
+        raise ValueError(f"No values given for '{name}'.")
+    return values
+
+# Facts table holding every combination of the grid values, the rest taken from base
+def _scenario_table(base, values):
+    names = list(values)
+    axes = np.meshgrid(*values.values(), indexing='ij')
+    n = axes[0].size
+    table = {name: np.full(n, base[name]) for name in FACT_COLUMNS if name in base}
+    for name, axis in zip(names, axes):
+        table[name] = axis.ravel()
+    return table
+
+# How far each scenario moves from base: the changes summed as fractions of each input's range
+def _effort(base, table, grid):
+    effort = np.zeros(len(table[FACT_COLUMNS[0]]))
+    for name in grid:
+        if name in FLAG_FIELDS:
+            effort += table[name] != base[name]
+        else:
+            spec = NUMBER_FIELDS[name]
+            effort += np.abs(table[name] - base[name]) / (spec['max_value'] - spec['min_value'])
+    return effort
+
+# Rows the form would accept. validate_facts only compares numbers with zero, so each
+# input's grid values fall into at most two classes (zero, positive) and only the
+# combinations of classes are checked, then broadcast back over the grid.
+def _valid_rows(base, values):
+    names = list(values)
+    samples = []
+    inverses = []
+    for name in names:
+        positive = values[name].astype(bool)
+        classes, inverse = np.unique(positive, return_inverse=True)
+        samples.append([values[name][np.argmax(positive == c)].item() for c in classes])
+        inverses.append(inverse)
+
+    valid = np.empty([len(sample) for sample in samples], dtype=bool)
+    facts = dict(base)
+    for index in np.ndindex(valid.shape):
+        facts.update((name, sample[i]) for name, sample, i in zip(names, samples, index))
+        valid[index] = not validate_facts(facts)
+    return valid[np.ix_(*inverses)].ravel()
+
+# Score every combination of `grid` ({input: values}) applied to `base` (a household's
+# form values) and return the `top` scenarios by savings, best first. Each row has the
+# changed inputs, the LKR/month range saved versus base, the range still left to save,
+# and the rules the change clears. Combinations the form would reject are skipped.
+def sweep(base, grid, top=20):
+    if not grid:
+        raise ValueError("The grid must vary at least one input.")
+    missing = [name for name in FACT_COLUMNS if name not in base and name not in OPTIONAL_FIELDS]
+    if missing:
+        raise ValueError(f"The base household is missing inputs: {', '.join(missing)}.")
+    errors = validate_facts(base)
+    if errors:
+        raise ValueError(' '.join(errors))
+    values = {name: _grid_values(name, grid[name]) for name in grid}
+    base_table = {name: [value] for name, value in base.items() if name in FACT_COLUMNS}
+    current = batch.evaluate(base_table)
+    table = _scenario_table(base, values)
+    result = batch.evaluate(table)
+    valid = _valid_rows(base, values)
+
+    remaining_min = result.min_savings.sum(axis=1)
+    remaining_max = result.max_savings.sum(axis=1)
+
+    # Per rule, what the change saves; for cleared rules whose formula it moves, only
+    # the formula's drop (at most the rule's current range)
+    base_min, base_max = batch.savings_ranges(base_table)
+    formula_min, formula_max = batch.savings_ranges(table)
+    partial = (current.fired & ~result.fired) & ((formula_min != base_min) | (formula_max != base_max))
+    saved_min = np.where(partial, np.clip(current.min_savings - formula_min, 0, current.min_savings),
+                         current.min_savings - result.min_savings).sum(axis=1)
+    saved_max = np.where(partial, np.clip(current.max_savings - formula_max, 0, current.max_savings),
+                         current.max_savings - result.max_savings).sum(axis=1)
+
+    # Best guaranteed saving first, then the upper end, then the smallest change
+    order = np.lexsort((_effort(base, table, grid), -saved_max, -saved_min))
+    order = order[valid[order]][:top]
+
+    rows = []
+    for i in order:
+        changes = {name: table[name][i].item() for name in grid if table[name][i] != base[name]}
+        cleared = current.fired[0] & ~result.fired[i]
+        rows.append({
+            'changes': changes,
+            'saved_min': int(saved_min[i]),
+            'saved_max': int(saved_max[i]),
+            'remaining_min': int(remaining_min[i]),
+            'remaining_max': int(remaining_max[i]),
+            'cleared_rules': [result.names[j] for j in np.flatnonzero(cleared)],
+        })
+    return rows
+
+# "name=start:stop:step" (stop included) or "name=v1,v2,..."
+def _parse_axis(text):
+    name, _, spec = text.partition('=')
+    if name in FLAG_FIELDS:
+        return name, [value.strip().lower() in ('1', 'true', 'yes') for value in spec.split(',')]
+    cast = int if isinstance(NUMBER_FIELDS.get(name, {}).get('step'), int) else float
+    if ':' in spec:
+        start, stop, *step = (cast(part) for part in spec.split(':'))
+        step = step[0] if step else NUMBER_FIELDS[name]['step']
+        return name, np.round(np.arange(start, stop + step / 2, step), 2)
+    return name, [cast(value) for value in spec.split(',')]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rank what-if changes to a household's inputs by the savings they capture.")
+    parser.add_argument("facts", help="JSON file with the household's form values")
+    parser.add_argument("--vary", action="append", required=True, metavar="NAME=SPEC",
+                        help="input to sweep, as start:stop[:step] or a comma-separated list (repeatable)")
+    parser.add_argument("--top", type=int, default=20, help="scenarios to show (default: %(default)s)")
+    args = parser.parse_args()
+
+    with open(args.facts, encoding='utf-8') as f:
+        base = json.load(f)
+    grid = dict(_parse_axis(axis) for axis in args.vary)
+    for row in sweep(base, grid, args.top):
+        print(json.dumps(row))
@@ -0,0 +1,178 @@
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+import argparse
+import asyncio
+import math
+import time
+import os
+
+from advisor import AdvisorPool
+from inputs import parse_record, validate_facts, build_facts
+from rephrase import iter_job_replies_async, polish
+import metrics
+
+# JSON advice API for partner integrations, served by any ASGI server:
+#   POST /advice[?deadline_ms=N]  household form values -> recommendations and explanations
+#   GET  /health                  liveness and the number of fact sets in flight
+
+# Seconds a request may wait at most; a request can ask for less with ?deadline_ms=
+DEADLINE = float(os.getenv("ADVISOR_SERVICE_DEADLINE", "10"))
+# Distinct fact sets being advised at once before new ones are turned away with a 503
+MAX_PENDING = int(os.getenv("ADVISOR_SERVICE_MAX_PENDING", "64"))
+# LLM calls in flight across all requests
+LLM_CONCURRENCY = int(os.getenv("ADVISOR_SERVICE_LLM_CONCURRENCY", "32"))
+
+# Advice for one fact set, shared by every request for it while in flight. Rules are
+# evaluated first; explanations are then polished in place as LLM replies arrive.
+class _Advice:
+    def __init__(self):
+        self.recs = self.fired = self.jobs = None
+        self.explanations = []
+        self.polished = []
+        self.error = None
+        self.evaluated = asyncio.Event()
+        self.done = asyncio.Event()
+
+    def set_rules(self, recs, fired, jobs):
+        self.recs, self.fired, self.jobs = recs, fired, jobs
+        self.explanations = [polish(job, None) for job in jobs]
+        self.polished = [False] * len(jobs)
+        self.evaluated.set()
+
+    # Response body as of now: explanations not yet polished keep the deterministic text
+    def body(self):
+        return {
+            'fired_rules': self.fired,
+            'advice': [
+                {'name': name, 'recommendation': rec, 'confidence': job['confidence'],
+                 'savings': job['savings_str'], 'explanation': explanation, 'polished': polished}
+                for name, rec, job, explanation, polished
+                in zip(self.fired, self.recs, self.jobs, self.explanations, self.polished)
+            ],
+            'complete': self.done.is_set(),
+        }
+
+def _error(status, *messages, headers=None):
+    return JSONResponse({'errors': list(messages)}, status_code=status, headers=headers)
+
+class AdviceService:
+    def __init__(self, pool=None, deadline=DEADLINE, max_pending=MAX_PENDING, llm_concurrency=LLM_CONCURRENCY):
+        self.pool = pool or AdvisorPool()
+        self.deadline = deadline
+        self.max_pending = max_pending
+        self.llm_concurrency = llm_concurrency
+        self._limiter = None   # Created on first use, inside the server's event loop
+        self._in_flight = {}   # facts key -> _Advice
+        self._tasks = set()    # Keeps running computations referenced
+
+    async def advise(self, request):
+        start = time.monotonic()
+        deadline = self.deadline
+        if 'deadline_ms' in request.query_params:
+            try:
+                deadline_ms = float(request.query_params['deadline_ms'])
+            except ValueError:
+                deadline_ms = None
+            if deadline_ms is None or not math.isfinite(deadline_ms) or deadline_ms < 0:
+                return _error(400, "deadline_ms must be a non-negative number.")
+            deadline = min(deadline, deadline_ms / 1000)
+        try:
+            record = await request.json()
+        except ValueError:
+            record = None
+        if not isinstance(record, dict):
+            return _error(400, "The request body must be a JSON object of form values.")
+
+        # Same checks as the form in app.py
+        form, errors = parse_record(record)
+        if not errors:
+            errors = validate_facts(form)
+        if errors:
+            metrics.count('service.rejected', reason='invalid')
+            return _error(422, *errors)
+        facts = build_facts(form)
+        # Optional label for the advice history's per-district reports
+        district = record.get('district')
+        if district is not None and not isinstance(district, str):
+            return _error(422, "'district' must be a string.")
+
+        # Identical fact sets already in flight share one computation
+        key = (tuple(sorted(facts.items())), district)
+        advice = self._in_flight.get(key)
+        if advice is not None:
+            metrics.count('service.coalesced')
+        elif len(self._in_flight) >= self.max_pending:
+            metrics.count('service.rejected', reason='overloaded')
+            return _error(503, "The advisor is busy, please retry shortly.", headers={'Retry-After': '1'})
+        else:
+            advice = self._in_flight[key] = _Advice()
+            task = asyncio.create_task(self._compute(key, facts, district, advice))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+        try:
+            await asyncio.wait_for(advice.done.wait(), max(0, deadline - (time.monotonic() - start)))
+        # Not the builtin TimeoutError before Python 3.11
+        except asyncio.TimeoutError:
+            metrics.count('service.deadline')
+        if advice.error is not None:
+            return _error(500, "Advice could not be generated.")
+        if not advice.evaluated.is_set():
+            return _error(504, "The deadline passed before the rules were evaluated.")
+        return JSONResponse(advice.body())
+
+    async def health(self, request):
+        return JSONResponse({'status': 'ok', 'in_flight': len(self._in_flight)})
+
+    # Semaphore capping LLM calls across requests. Built lazily: before Python 3.10
+    # an asyncio primitive binds to the loop current at creation, and the app is
+    # created before the server starts its loop.
+    def _llm_limiter(self):
+        if self._limiter is None:
+            self._limiter = asyncio.Semaphore(self.llm_concurrency)
+        return self._limiter
+
+    # Evaluate the rules off the event loop, then polish explanations until the
+    # service deadline; requests with shorter deadlines read whatever is ready
+    async def _compute(self, key, facts, district, advice):
+        try:
+            with metrics.span('service.evaluate'):
+                advice.set_rules(*await asyncio.to_thread(self.pool._evaluate, facts, district))
+            replies = iter_job_replies_async(advice.jobs, self.pool.max_concurrency, self.deadline,
+                                             self.pool.rephrase_mode, self._llm_limiter(), self.pool.render_policy)
+            async for i, content in replies:
+                advice.explanations[i] = polish(advice.jobs[i], content)
+                advice.polished[i] = True
+            metrics.count('advice.fallback', advice.polished.count(False))
+        except Exception as exc:
+            advice.error = exc
+        finally:
+            del self._in_flight[key]
+            advice.done.set()
+
+def create_app(**settings):
+    service = AdviceService(**settings)
+    app = Starlette(routes=[
+        Route('/advice', service.advise, methods=['POST']),
+        Route('/health', service.health, methods=['GET']),
+    ])
+    app.state.service = service
+    return app
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve energy advice as JSON over HTTP.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--fake-llm", type=float, metavar="LATENCY",
+                        help="answer with a local stand-in for the Inference API, mean seconds per call")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="failure rate of the stand-in (default: 0)")
+    args = parser.parse_args()
+
+    if args.fake_llm is not None:
+        import llm
+        from benchmark import FakeAsyncInferenceClient
+        llm.set_async_client(FakeAsyncInferenceClient(args.fake_llm, failure_rate=args.failure_rate))
+
+    import uvicorn
+    uvicorn.run(create_app(), host=args.host, port=args.port)
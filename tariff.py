@@ -0,0 +1,66 @@
+from functools import lru_cache
+import numpy as np
+import json
+import os
+
+TARIFF_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tariffs")
+DEFAULT_TARIFF = os.getenv("ADVISOR_TARIFF", "ceb_domestic")
+
+# Flat LKR/kWh the savings formulas in rules.py were written against
+FLAT_RATE = 30
+
+# Block tariff with cumulative-cost lookup arrays precomputed per regime, so a bill
+# for any number of households is a searchsorted plus a few array operations
+class BlockTariff:
+    def __init__(self, schedule):
+        self.name = schedule['name']
+        self.effective = schedule.get('effective')
+        self._regimes = []
+        for regime in schedule['regimes']:
+            ends = np.array([np.inf if b['upto'] is None else b['upto'] for b in regime['blocks']], dtype=np.float64)
+            starts = np.concatenate(([0.0], ends[:-1]))
+            rates = np.array([b['rate'] for b in regime['blocks']], dtype=np.float64)
+            fixed = np.array([b.get('fixed', 0) for b in regime['blocks']], dtype=np.float64)
+            # Energy charge accumulated up to the start of each block
+            cumulative = np.concatenate(([0.0], np.cumsum((ends[:-1] - starts[:-1]) * rates[:-1])))
+            max_kwh = np.inf if regime.get('max_kwh') is None else regime['max_kwh']
+            self._regimes.append((max_kwh, starts, ends, rates, fixed, cumulative))
+
+    # Monthly bill in LKR for each consumption in `kwh` (scalar or array)
+    def bill(self, kwh):
+        kwh = np.maximum(np.asarray(kwh, dtype=np.float64), 0.0)
+        total = np.full(kwh.shape, np.nan)
+        unbilled = np.ones(kwh.shape, dtype=bool)
+        for max_kwh, starts, ends, rates, fixed, cumulative in self._regimes:
+            idx = np.minimum(np.searchsorted(ends, kwh, side='left'), len(ends) - 1)
+            cost = cumulative[idx] + (kwh - starts[idx]) * rates[idx] + fixed[idx]
+            use = unbilled & (kwh <= max_kwh)
+            total = np.where(use, cost, total)
+            unbilled &= ~use
+        return total
+
+    # Bill reduction from cutting `delta_kwh` off a monthly consumption of `kwh`
+    def saving(self, kwh, delta_kwh):
+        kwh = np.asarray(kwh, dtype=np.float64)
+        return self.bill(kwh) - self.bill(kwh - np.asarray(delta_kwh, dtype=np.float64))
+
+@lru_cache(maxsize=None)
+def load_tariff(name=DEFAULT_TARIFF):
+    with open(os.path.join(TARIFF_DIR, f"{name}.json"), encoding='utf-8') as f:
+        return BlockTariff(json.load(f))
+
+# Re-price flat-rate savings on the household's own tariff blocks. The rules' LKR
+# figures are kWh deltas priced at FLAT_RATE; rows with an unknown consumption
+# (monthly_kwh <= 0) keep the flat figures. Works on scalars and arrays alike.
+def tariff_savings(monthly_kwh, min_lkr, max_lkr, tariff=None):
+    tariff = tariff or load_tariff()
+    kwh = np.asarray(monthly_kwh, dtype=np.float64)
+    known = kwh > 0
+    if not known.any():
+        # Nothing to re-price; skip the bill computations
+        low = np.broadcast_to(min_lkr, np.broadcast_shapes(kwh.shape, np.shape(min_lkr)))
+        high = np.broadcast_to(max_lkr, np.broadcast_shapes(kwh.shape, np.shape(max_lkr)))
+        return low.astype(np.int64), high.astype(np.int64)
+    low = np.where(known, np.rint(tariff.saving(kwh, np.asarray(min_lkr) / FLAT_RATE)), min_lkr)
+    high = np.where(known, np.rint(tariff.saving(kwh, np.asarray(max_lkr) / FLAT_RATE)), max_lkr)
+    return low.astype(np.int64), high.astype(np.int64)
@@ -0,0 +1,76 @@
+from rules import format_savings
+from registry import ORDERED_RULES
+from inputs import field_values
+from cache import prompt_key
+import itertools
+import argparse
+import json
+import os
+
+# Pre-rendered explanations, produced offline by `python templates.py`
+TEMPLATES_PATH = os.getenv("ADVISOR_TEMPLATES_PATH", "explanations.json")
+
+# Every distinct rephrasing job the form can produce. Fixed-savings rules give one
+# job each; callable-savings rules are stepped through the input domains they read.
+def enumerate_jobs():
+    jobs = []
+    for rule in ORDERED_RULES:
+        if callable(rule.savings):
+            domains = [field_values(name) for name in rule.facts]
+            ranges = set()
+            for values in itertools.product(*domains):
+                facts = dict(zip(rule.facts, values))
+                if rule.condition(facts):
+                    ranges.add(format_savings(rule.savings, facts))
+        else:
+            ranges = {format_savings(rule.savings, {})}
+
+        for savings_str in sorted(ranges):
+            jobs.append({'name': rule.name, 'raw': rule.explanation, 'savings_str': savings_str,
+                         'confidence': rule.confidence})
+    return jobs
+
+# Load the artifact as {prompt key: cleaned reply}; empty if it hasn't been built
+def load_templates(path=TEMPLATES_PATH):
+    if not path or not os.path.exists(path):
+        return {}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)['entries']
+
+# Rephrase every enumerated job and write the artifact. Entries already in the
+# artifact are kept, so re-running only fills the gaps left by failed calls.
+def warm(path=TEMPLATES_PATH, max_concurrency=None, timeout=None):
+    from rephrase import MODEL, MAX_CONCURRENCY, CALL_TIMEOUT, job_prompt, fetch_replies
+
+    entries = load_templates(path)
+    prompts = {}
+    for job in enumerate_jobs():
+        prompt = job_prompt(job)
+        key = prompt_key(MODEL, prompt)
+        if key not in entries:
+            prompts[key] = prompt
+
+    keys = list(prompts)
+    replies = fetch_replies(
+        [prompts[key] for key in keys],
+        max_concurrency or MAX_CONCURRENCY,
+        timeout or CALL_TIMEOUT,
+        use_templates=False
+    )
+    for key, reply in zip(keys, replies):
+        if reply:
+            entries[key] = reply
+
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'model': MODEL, 'entries': entries}, f, ensure_ascii=False, separators=(',', ':'))
+    return len(entries), sum(1 for reply in replies if not reply)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pre-render LLM explanations for every prompt the form can produce.")
+    parser.add_argument("--output", default=TEMPLATES_PATH, help="artifact path (default: %(default)s)")
+    parser.add_argument("--concurrency", type=int, help="parallel LLM calls")
+    parser.add_argument("--timeout", type=float, help="seconds allowed per LLM call")
+    args = parser.parse_args()
+
+    total, failed = warm(args.output, args.concurrency, args.timeout)
+    print(f"Wrote {total} explanations to {args.output} ({failed} calls failed, re-run to retry)")
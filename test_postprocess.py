@@ -0,0 +1,51 @@
+import pytest
+
+from postprocess import clean_reply, missing_figures, finalize
+
+# Reply clean-up: what the one-pass regex rewrites and, as much, what it must leave alone
+
+@pytest.mark.parametrize('reply, cleaned', [
+    # Currencies become LKR as whole words only
+    ("Save 20 USD a month.", "Save 20 LKR a month."),
+    ("Save 20 dollars, or one Dollar.", "Save 20 LKR, or one LKR."),
+    ("Join the community of savers.", "Join the community of savers."),
+    ("Check USDA labels.", "Check USDA labels."),
+    # Units and kWh only after a number
+    ("Save 250 units a month.", "Save 250 LKR a month."),
+    ("Save 1 Unit.", "Save 1 LKR."),
+    ("That is 3kWh a day.", "That is 3LKR a day."),
+    ("About 5 kWh less.", "About 5 LKR less."),
+    ("The unit works harder in the heat.", "The unit works harder in the heat."),
+    ("Units and kWh add up.", "Units and kWh add up."),
+    ("The United team", "The United team"),
+    # The model's notes about itself go, with the punctuation they leave hanging
+    ("Save LKR 200-350/month (I removed the dollar sign).", "Save LKR 200-350/month."),
+    ("Unplug the TV (this sounds more natural) .", "Unplug the TV."),
+    ("Use a timer (Removed 'units') , then relax.", "Use a timer, then relax."),
+    ("Use a timer (see the manual).", "Use a timer (see the manual)."),
+    # Line breaks and repeated spaces collapse
+    ("Save  more\nnow.", "Save more now."),
+])
+def test_clean_reply(reply, cleaned):
+    assert clean_reply(reply) == cleaned
+
+@pytest.mark.parametrize('reply, savings_str, missing', [
+    ("Save LKR 200-350/month, 85% confidence.", "200-350", (False, False)),
+    # Both ends present however they're written
+    ("Save LKR 1,800 to 2,700 a month; 85% sure.", "1800-2700", (False, False)),
+    ("Save LKR 1800 - 2700 a month (85 % confidence).", "1800-2700", (False, False)),
+    # A longer number containing the range doesn't count
+    ("Save LKR 1200-3500 a month, 85% confidence.", "200-350", (True, False)),
+    ("Save LKR 1,800 a month, 85% confidence.", "1800-2700", (True, False)),
+    # Confidence must be a percentage
+    ("Save LKR 1,800 to 2,700 with confidence 85.", "1800-2700", (False, True)),
+    ("Save LKR 1,800 to 2,700, 185% sure.", "1800-2700", (False, True)),
+])
+def test_missing_figures(reply, savings_str, missing):
+    assert missing_figures(reply, savings_str, 85) == missing
+
+def test_finalize_appends_only_missing_figures():
+    assert finalize("Save LKR 200-350/month at 85%.", "200-350", 85) == "Save LKR 200-350/month at 85%."
+    assert finalize("Save 1200-3500 monthly.", "200-350", 85) == (
+        "Save 1200-3500 monthly. (Savings: ~LKR 200-350/month) (Confidence: 85%)"
+    )
@@ -0,0 +1,153 @@
+import random
+import json
+import os
+
+import numpy as np
+import pytest
+
+import batch
+import rulepack
+from rules import format_savings
+from registry import ORDERED_RULES, RuleRecord
+from inputs import FACT_COLUMNS, FACT_DEFAULTS, field_values
+
+# Rule packs: expression checks, agreement of the compiled forms with each other and
+# with the experta engine, and the on-disk cache of compiled packs.
+
+def _rule(**overrides):
+    rule = {'name': 'Test_Rule', 'when': 'has_ac and ac_hours >= 5', 'recommendation': 'r', 'explanation': 'e',
+            'savings': [100, 200], 'confidence': 80}
+    rule.update(overrides)
+    return rule
+
+@pytest.mark.parametrize('overrides, message', [
+    ({'when': 'fan_count and has_ac'}, "'fan_count' is not a comparison or a yes/no fact"),
+    ({'when': '5'}, "'5' is not a comparison or a yes/no fact"),
+    ({'when': 'fans > 1'}, "unknown fact 'fans'"),
+    ({'when': 'has_ac >'}, "invalid expression"),
+    ({'when': "ac_hours > '5'"}, "unsupported expression"),
+    ({'when': 'ac_hours.real > 5'}, "unsupported expression"),
+    ({'when': '__import__("os") == 1'}, "unsupported expression"),
+    ({'savings': ['pow(fan_count, 2)', 10]}, "unsupported expression"),
+    ({'savings': ['fan_count ** 2', 10]}, "unsupported expression"),
+    ({'savings': ['int(fan_count, 2)', 10]}, "unsupported expression"),
+    ({'savings': ['max(fan_count)', 10]}, "unsupported expression"),
+    ({'savings': ['fan_count > 1', 10]}, "savings must be amounts"),
+    ({'savings': ['max(0, not has_ac)', 10]}, "savings must be amounts"),
+    ({'savings': [100]}, "savings must be a [min, max] pair"),
+    ({'savings': [1.5, 3]}, "savings must be whole numbers of LKR or formulas"),
+    ({'savings': [True, 3]}, "savings must be whole numbers of LKR or formulas"),
+])
+def test_rejected_expressions(overrides, message):
+    with pytest.raises(ValueError) as error:
+        rulepack.pack_source({'rules': [_rule(**overrides)]})
+    assert "Rule 'Test_Rule'" in str(error.value)
+    assert message in str(error.value)
+
+def test_missing_keys_are_rejected():
+    rule = _rule()
+    del rule['when'], rule['confidence']
+    with pytest.raises(ValueError, match="missing when, confidence"):
+        rulepack.pack_source({'rules': [rule]})
+
+def test_chained_comparisons_and_defaults(tmp_path):
+    path = tmp_path / 'pack.json'
+    path.write_text(json.dumps({'rules': [_rule(when='1 <= fan_count < 4 or not has_fans',
+                                                savings=['max(10, fan_count * 20, 30)', 90])]}))
+    rule = rulepack.load_rule_pack(str(path), cache_dir=None)[0][0]
+    assert rule['facts'] == ('fan_count', 'has_fans')
+    # Missing facts take the form defaults: no fans ticked
+    assert rule['condition']({})
+    assert rule['condition']({'has_fans': True, 'fan_count': 3})
+    assert not rule['condition']({'has_fans': True, 'fan_count': 4})
+    assert rule['savings']({'fan_count': 3}) == (60, 90)
+    columns = {'fan_count': np.array([0, 3, 4]), 'has_fans': np.array([True, True, True])}
+    assert rule['vector_condition'](columns).tolist() == [False, True, False]
+    assert rule['vector_savings'](columns)[0].tolist() == [30, 60, 80]
+
+# Random complete households, some with a known monthly consumption
+def _profiles(n, seed=7):
+    rng = random.Random(seed)
+    domains = {name: field_values(name) for name in FACT_COLUMNS if name != 'monthly_kwh'}
+    profiles = []
+    for _ in range(n):
+        facts = {name: rng.choice(values) for name, values in domains.items()}
+        facts['monthly_kwh'] = rng.choice([0, 0, 45, 90, 250, 700])
+        profiles.append(facts)
+    return profiles
+
+# Fractional formulas and conditions with a constant part, which the default pack lacks
+_FLOAT_PACK = {'rules': [
+    _rule(name='Fans', when='has_fans and fan_count > 0', savings=['fan_count * 2.5', 'fan_hours * 7.3 + 0.9']),
+    _rule(name='Never', when='not 1 > 0', savings=[100, 200]),
+    _rule(name='Always', when='not 1 > 2 and not has_ac', savings=['0.5', 'max(1.5, ac_hours / 3)']),
+]}
+
+@pytest.mark.parametrize('pack', ['default', 'float'])
+def test_condition_test_and_batch_agree(pack, tmp_path, monkeypatch):
+    rules = ORDERED_RULES
+    if pack == 'float':
+        path = tmp_path / 'float.json'
+        path.write_text(json.dumps(_FLOAT_PACK))
+        rules = tuple(RuleRecord(rule, rank) for rank, rule in enumerate(rulepack.load_rule_pack(str(path), None)[0]))
+        monkeypatch.setattr(batch, 'ORDERED_RULES', rules)
+    profiles = _profiles(2000)
+    result = batch.evaluate({name: [facts[name] for facts in profiles] for name in FACT_COLUMNS})
+    for i, facts in enumerate(profiles):
+        fired = [rule for rule in rules if rule.condition(facts)]
+        for rule in rules:
+            named = {name: facts[name] for name in rule.test.__code__.co_varnames}
+            assert bool(rule.test(**named)) == bool(rule.condition(facts)), rule.name
+        _, batch_fired, batch_savings = result.row(i)
+        assert batch_fired == [rule.name for rule in fired]
+        assert batch_savings == [format_savings(rule.savings, facts) for rule in fired]
+
+def test_engine_agrees_with_conditions():
+    try:
+        from advisor import EnergyAdvisor
+    except (ImportError, AttributeError) as exc:   # experta's frozendict needs Python <= 3.9
+        pytest.skip(f"experta unavailable: {exc}")
+    engine = EnergyAdvisor()
+    for facts in _profiles(300, seed=11) + [{}, {'fan_count': 3, 'fan_hours': 5}]:
+        _, fired, jobs = engine._evaluate(facts)
+        filled = {**FACT_DEFAULTS, **facts}
+        expected = [rule for rule in ORDERED_RULES if rule.condition(facts)]
+        assert fired == [rule.name for rule in expected]
+        assert [job['savings_str'] for job in jobs] == [format_savings(rule.savings, filled) for rule in expected]
+
+def test_compiled_pack_is_cached(tmp_path, monkeypatch):
+    cache_dir = str(tmp_path / 'cache')
+    rules, ui_order = rulepack.load_rule_pack(cache_dir=cache_dir)
+    entries = os.listdir(cache_dir)
+    assert len(entries) == 1
+
+    # A cache hit runs the stored code without compiling the pack again
+    def no_compile(pack):
+        raise AssertionError("pack compiled despite a cache hit")
+    monkeypatch.setattr(rulepack, 'pack_source', no_compile)
+    cached, cached_order = rulepack.load_rule_pack(cache_dir=cache_dir)
+    assert cached_order == ui_order
+    assert [rule['name'] for rule in cached] == [rule['name'] for rule in rules]
+    facts = _profiles(1)[0]
+    assert [rule['condition'](facts) for rule in cached] == [rule['condition'](facts) for rule in rules]
+
+def test_corrupt_cache_entry_is_recompiled(tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    rules, _ = rulepack.load_rule_pack(cache_dir=cache_dir)
+    entry = os.path.join(cache_dir, os.listdir(cache_dir)[0])
+    with open(entry, 'wb') as f:
+        f.write(b'not marshal data')
+
+    reloaded, _ = rulepack.load_rule_pack(cache_dir=cache_dir)
+    assert [rule['name'] for rule in reloaded] == [rule['name'] for rule in rules]
+    with open(entry, 'rb') as f:
+        assert f.read() != b'not marshal data'
+
+def test_changed_pack_gets_a_new_cache_entry(tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    path = tmp_path / 'pack.json'
+    path.write_text(json.dumps({'rules': [_rule()]}))
+    assert rulepack.load_rule_pack(str(path), cache_dir)[0][0]['savings'] == (100, 200)
+    path.write_text(json.dumps({'rules': [_rule(savings=[150, 250])]}))
+    assert rulepack.load_rule_pack(str(path), cache_dir)[0][0]['savings'] == (150, 250)
+    assert len(os.listdir(cache_dir)) == 2